@@ -18,6 +18,10 @@ import warnings
 import numpy as np
 
 from utils import pgo
+from utils import cube
+from utils import raster_export
+from utils import profiling
+from utils import table_writer
 
 #======================================================================================================================#
 # define data selection and specification of difference map categories
@@ -31,7 +35,13 @@ labels = periodes
 out_dir = r'd:\hotspot_working\z_out\20190619'
 print_table = False
 print_shp = False
+print_tif = False  # all columns per cell as multi-band GeoTIFF on the 250m grid
 print_all_tables = True
+print_parquet = False  # table of all soorten also as Parquet file, for use in other software
+
+# timing and memory per stage (see utils/profiling.py) as JSON or CSV report, None for no report
+profile_report = None  # eg. os.path.join(out_dir, 'stages.json')
+profiling.profile_dir = None  # directory for a cProfile dump of the slowest stage, None for no dump
 
 holder = []
 
@@ -39,7 +49,9 @@ holder = []
 # start of analysis
 query = 'periode in {0} & ' \
         'soortgroep in {1} & soortlijst in {2}'.format(periodes, pgo.parse_soort_sel(soort), soort_lijst)
-dat_sel = pgo.query_all_obs(query)
+with profiling.stage('load') as rec:
+    dat_sel = pgo.query_all_obs(query)
+    rec['rows'] = dat_sel.shape[0]
 
 if dat_sel.empty:
     print('\tNo records remaining for criteria groep={0}, '
@@ -49,22 +61,15 @@ else:
 
 #==================================================================================================================#
 # create pivot table with stats per hok_id
-dat_piv = pd.pivot_table(data=dat_sel, index='hok_id', columns=['periode', 'soortgroep', 'soortlijst'], values='n',
-                         aggfunc='sum', dropna=False)
-dat_piv.replace(0.0, np.NaN, inplace=True)
+with profiling.stage('pivot', rows=dat_sel.shape[0]):
+    dat_piv = cube.ObsCube(dat_sel).pivot(columns=['periode', 'soortgroep', 'soortlijst'], dropna=False)
+    dat_piv.replace(0.0, np.NaN, inplace=True)
 
 print('\tcontaining {0} cells with observations'.format(dat_piv.shape[0]))
 del dat_sel
 
-# Join to df with count and area beheertypen per cell
-snl_per_cell = pgo.get_snl_hokids('all', 0)  ## Note, this retrieves ALL 250m hokken!
-if set(dat_piv.index) - set(snl_per_cell['hok_id']):
-    warnings.warn('\tBeware, there are cells(s) with observations, but not marked as belonging to the SNL type(s)!')
-dat_piv2 = pd.merge(dat_piv, snl_per_cell, how='left', left_index=True, right_on='hok_id')
-
-del snl_per_cell
-
-# Reduce colnames to 10 chars max, taking into account nested colnames
+# Reduce colnames to 10 chars max, taking into account nested colnames. Done before the merge, pandas does not merge
+# nested with single level colnames
 col_short = {'2010-2017': '1017', '1994-2001': '9401', '2002-2009': '0209', 'vogel': 'Vo', 'vlinder': 'Vl',
              'vaatplant': 'Pl', 'SNL': 'SNL', 'Bijl1': 'B1', 'cap': 'c', 'tot': 't'}
 colnames = dat_piv.columns.tolist()
@@ -80,7 +85,18 @@ for col in colnames:
         new_colnames.append(''.join(x for x in tup_items))
     else:
         new_colnames.append(col)
-dat_piv.rename(columns=dict(zip(colnames, new_colnames)), inplace=True)
+dat_piv.columns = new_colnames
+
+# Join to df with count and area beheertypen per cell
+with profiling.stage('merge') as rec:
+    snl_per_cell = pgo.get_snl_hokids('all', 0)  ## Note, this retrieves ALL 250m hokken with an SNL beheertype!
+    if set(dat_piv.index) - set(snl_per_cell['hok_id']):
+        warnings.warn('\tBeware, there are cells(s) with observations, but not marked as belonging to the SNL '
+                      'type(s)!')
+    dat_piv2 = pd.merge(dat_piv, snl_per_cell, how='left', left_index=True, right_on='hok_id')
+    rec['rows'] = dat_piv2.shape[0]
+
+del snl_per_cell
 
 #==================================================================================================================#
 # Generate output as requested
@@ -90,26 +106,33 @@ out_base_name = 'SNL-all_Srt-{0}_Lst-{1}_P{2}_{3}'.format(soort, ''.join([x for
                                                          '-'.join([p for p in periodes]),
                                                          pgo.get_timestring('brief'))
 
-if print_table:
-    with open(os.path.join(out_dir, out_base_name + '.csv'), 'w') as f:
-        # header
-        f.write('# Tabulated extract PGO Hotspots data, '
-                'by Hans Roelofsen, {0}, WEnR team B&B.\n'.format(pgo.get_timestring('full')))
-        f.write('# Query from PGO data was: {0}\n'.format(query))
+# header lines of table outputs
+header = ['Tabulated extract PGO Hotspots data, '
+          'by Hans Roelofsen, {0}, WEnR team B&B.'.format(pgo.get_timestring('full')),
+          'Query from PGO data was: {0}'.format(query)]
+csv_header = header + ['Missing values are written as {0}'.format(table_writer.sentinel)]
 
+if print_table:
+    with profiling.stage('write', rows=dat_piv.shape[0]):
         # write table with soorten count per hok
-        float64cols = [k for k, v in dat_piv.dtypes.astype(str).to_dict().items() if v == 'float64']
-        f.write(dat_piv.fillna(9999).astype(dtype=dict(zip(float64cols, [np.int32]*len(float64cols)))).to_csv(sep=';', header=True, index=False))
-
+        table_writer.write_table(os.path.join(out_dir, out_base_name + '.csv'), dat_piv, csv_header, index=True)
         print('\twritten to table at {0}'.format(pgo.get_timestring('full')))
 
 if print_shp:
-    hokken = pgo.get_250m_hokken()  # geodataframe of 250m hokken
-    dat_gdf = pd.merge(left=dat_piv, right=hokken, left_on='hok_id', right_on='ID', how='inner')
-    dat_gdf = gp.GeoDataFrame(dat_gdf, crs={"init": "epsg:28992"})
+    with profiling.stage('write', rows=dat_piv.shape[0]):
+        hokken = pgo.get_250m_hokken()  # geodataframe of 250m hokken
+        dat_gdf = pd.merge(left=dat_piv, right=hokken, left_index=True, right_on='hok_id', how='inner')
+        dat_gdf = gp.GeoDataFrame(dat_gdf.assign(hok_id=dat_gdf['ID']), crs={"init": "epsg:28992"})
+
+        dat_gdf.to_file(os.path.join(out_dir, 'shp', out_base_name + '.shp'))
+        print('\twritten to shapefile at {0}'.format(pgo.get_timestring('full')))
 
-    dat_gdf.to_file(os.path.join(out_dir, 'shp', out_base_name + '.shp'))
-    print('\twritten to shapefile at {0}'.format(pgo.get_timestring('full')))
+if print_tif:
+    with profiling.stage('write', rows=dat_piv.shape[0]):
+        affine, shape = pgo.get_grid()
+        raster_export.write_cells_raster(dat_piv.reset_index(), dat_piv.columns.tolist(),
+                                         os.path.join(out_dir, out_base_name + '.tif'), affine, shape)
+        print('\twritten to GeoTIFF at {0}'.format(pgo.get_timestring('full')))
 
 if print_all_tables:
     holder.append(dat_piv)
@@ -119,17 +142,16 @@ if print_all_tables:
     dat_out = pd.concat(holder)
     out_name = 'SNL-all_Srt-{0}_Lst-{1}_P{2}_{3}'.format(soort, ''.join([x for x in soort_lijst]),
                                                          '-'.join([p for p in periodes]), pgo.get_timestring('brief'))
-    with open(os.path.join(out_dir, out_base_name + '.csv'), 'w') as f:
-        # header
-        f.write('# Tabulated extract PGO Hotspots data, '
-                'by Hans Roelofsen, {0}, WEnR team B&B.\n'.format(pgo.get_timestring('full')))
-        f.write('# Query from PGO data was: {0}\n'.format(query))
-
+    with profiling.stage('write', rows=dat_out.shape[0]):
         # write table with soorten count per hok
-        float64cols = [k for k, v in dat_out.dtypes.astype(str).to_dict().items() if v == 'float64']
-        f.write(dat_out.fillna(9999).astype(dtype=dict(zip(float64cols, [np.int32] * len(float64cols)))).to_csv(sep=';',
-                                                                                                                header=True,
-                                                                                                                index=False))
+        table_writer.write_table(os.path.join(out_dir, out_name + '.csv'), dat_out, csv_header, index=True)
         print('\twritten to table at {0}'.format(pgo.get_timestring('full')))
 
+    if print_parquet:
+        with profiling.stage('write', rows=dat_out.shape[0]):
+            table_writer.write_parquet(os.path.join(out_dir, out_name + '.parquet'), dat_out, header, index=True)
+            print('\twritten to Parquet at {0}'.format(pgo.get_timestring('full')))
 
+if profile_report:
+    profiling.write_report(profile_report, info={'script': 'analyse_for_VHR_tab', 'soort': soort,
+                                                 'soort_lijst': soort_lijst})
@@ -5,7 +5,7 @@
 #             \Soortlijst
 #             <n soorten>
 #
-# Note that a 250m hok may intersect > 1 provincie, so hok_ids may be doubled in the output table
+# Note that a 250m hok may intersect > 1 provincie, the provincie column holds the provincie covering most of the hok
 #
 # By Hans Roelofsen, WEnR, 08/04/2019
 #
@@ -18,6 +18,12 @@ import warnings
 import numpy as np
 
 from utils import pgo
+from utils import obs_session
+from utils import parallel
+from utils import grouped
+from utils import raster_export
+from utils import profiling
+from utils import table_writer
 
 #======================================================================================================================#
 # define data selection and specification of difference map categories
@@ -32,13 +38,29 @@ labels = periodes
 out_dir = r'd:\hotspot_working\z_out\20190704'
 print_table = False
 print_shp = False
+print_tif = False  # all numeric columns per cell as multi-band GeoTIFF on the 250m grid
 print_all_tables = True
+print_parquet = False  # table of all snl types also as Parquet file, for use in other software
 
-holder = []
+# compute the table of all snl types in one grouped pass (see utils/grouped.py) instead of per snl type. Applies when
+# only the table of all snl types is requested, the per snl type outputs (print_table, print_shp, print_tif) need the
+# analysis per snl type
+single_pass = True
+
+# number of worker processes for the snl types, 1 runs all snl types one after the other in this process
+n_workers = 1
+
+# timing and memory per stage and snl type (see utils/profiling.py) as JSON or CSV report, None for no report
+profile_report = None  # eg. os.path.join(out_dir, 'stages.json')
+profiling.profile_dir = None  # directory for a cProfile dump of the slowest stage, None for no dump
 
 #======================================================================================================================#
-# Analyse per snl type
-for snl in snl_types:
+# Analyse per snl type. Observations are loaded once and kept in memory for all snl types, see __main__ below
+
+def analyse_snl(snl):
+    # full analysis and per-type output for a single snl type, returns the table for print_all_tables. The shared
+    # ObsSession is retrieved from parallel.get_shared()
+    obs = parallel.get_shared()
 
     print('\n{0} in progress at {1}'.format(snl, pgo.get_timestring('full')))
 
@@ -48,67 +70,58 @@ for snl in snl_types:
     # formulate data query and get data
     query = 'snl in {0} & periode in {1} & ' \
             'soortgroep in {2} & soortlijst in {3}'.format(snl_list, periodes, pgo.parse_soort_sel(soort), soort_lijst)
-    dat_sel = pgo.query_all_obs(query)
+    with profiling.stage('filter', snl) as rec:  # includes loading from disk, unless preloaded
+        dat_sel = obs.query(query)
+        rec['rows'] = dat_sel.shape[0]
 
     if dat_sel.empty:
         print('\tNo records remaining for criteria groep={0}, '
               'snl_types={1} and periodes={2}'.format(soort, snl, ', '.join([p for p in periodes])))
-        continue
+        return
     else:
         print('\tFound {0} records complying to query'.format(dat_sel.shape[0]))
 
     #==================================================================================================================#
     # create pivot table with stats per hok_id
-    dat_piv = pd.pivot_table(data=dat_sel, index='hok_id', columns=['periode', 'soortgroep', 'soortlijst'],
-                             values='n', aggfunc='sum', dropna=False)
-    dat_piv.replace(0.0, np.NaN, inplace=True)
-
-    print('\tcontaining {0} cells with observations'.format(dat_piv.shape[0]))
-    del dat_sel
-
-    # calculate total and capped Bijl1 soorten per periode
-    for periode in periodes:
-        try:
-            bijl1_only = dat_piv.xs((periode, 'Bijl1'), level=[0, 2], axis=1)
-            bijl1_tot = bijl1_only.sum(axis=1)  # sum per over rows, i.e. over species-groups
-            bijl1_cap = pd.Series(np.where(bijl1_tot > 2, 2, bijl1_tot), index=bijl1_tot.index)  # if > 2, then 2
-            dat_piv[(periode, 'B1tot', '')] = bijl1_tot  # add as new columns under the periode
-            dat_piv[(periode, 'B1cap', '')] = bijl1_cap
-        except KeyError:  # not all periods may be present
-            continue
+    with profiling.stage('pivot', snl, rows=dat_sel.shape[0]):
+        obs_cube = obs.cube(query, dat_sel)
+        dat_piv = obs_cube.pivot(columns=['periode', 'soortgroep', 'soortlijst'], dropna=False)
+        dat_piv.replace(0.0, np.NaN, inplace=True)
+
+        print('\tcontaining {0} cells with observations'.format(dat_piv.shape[0]))
+        del dat_sel
+
+        # calculate total and capped Bijl1 soorten per periode
+        for periode in periodes:
+            try:
+                bijl1_tot = obs_cube.total(periode=periode, soortlijst='Bijl1')  # sum over species-groups
+                bijl1_cap = obs_cube.total(periode=periode, soortlijst='Bijl1', cap=2)  # if > 2, then 2
+                dat_piv[(periode, 'B1tot', '')] = bijl1_tot  # add as new columns under the periode
+                dat_piv[(periode, 'B1cap', '')] = bijl1_cap
+            except KeyError:  # not all periods may be present
+                continue
+
+    # Reduce colnames to 10 chars max, taking into account nested colnames. Done before the merge, pandas does not
+    # merge nested with single level colnames
+    dat_piv.columns = grouped.short_colnames(dat_piv.columns)
 
     # Join to df with count and area beheertypen per cell
-    snl_per_cell = pgo.get_snl_hokids(snl_list, 0)
-    if set(dat_piv.index) - set(snl_per_cell['hok_id']):
-        warnings.warn('\tBeware, there are cells(s) with observations, but not marked as belonging to the SNL type(s)!')
-    dat_piv = pd.merge(dat_piv, snl_per_cell, how='inner', left_index=True, right_on='hok_id')
+    with profiling.stage('merge', snl) as rec:
+        snl_per_cell = pgo.get_snl_hokids(snl_list, 0)
+        if set(dat_piv.index) - set(snl_per_cell['hok_id']):
+            warnings.warn('\tBeware, there are cells(s) with observations, but not marked as belonging to the SNL '
+                          'type(s)!')
+        dat_piv = pd.merge(dat_piv, snl_per_cell, how='inner', left_index=True, right_on='hok_id')
+        rec['rows'] = dat_piv.shape[0]
 
     try:
-        del snl_per_cell, bijl1_only, bijl1_tot, bijl1_cap
+        del snl_per_cell, obs_cube, bijl1_tot, bijl1_cap
     except NameError:
         pass
 
     # Label with snl type
     dat_piv['snl_type'] = snl
 
-    # Reduce colnames to 10 chars max, taking into account nested colnames
-    col_short = {'2010-2017': '1017', '1994-2001': '9401', '2002-2009': '0209', 'vogel': 'Vo', 'vlinder': 'Vl',
-                 'vaatplant': 'Pl', 'SNL': 'SNL', 'Bijl1': 'B1', 'cap': 'c', 'tot': 't'}
-    colnames = dat_piv.columns.tolist()
-    new_colnames = []
-    for col in colnames:
-        if isinstance(col, tuple):
-            tup_items = []
-            for x in col:
-                try:
-                    tup_items.append(col_short[x])
-                except KeyError:
-                    tup_items.append(x)
-            new_colnames.append(''.join(x for x in tup_items))
-        else:
-            new_colnames.append(col)
-    dat_piv.rename(columns=dict(zip(colnames, new_colnames)), inplace=True)
-
     #==================================================================================================================#
     # Generate output as requested
 
@@ -118,31 +131,61 @@ for snl in snl_types:
                                                              pgo.get_timestring('brief'))
 
     if print_table:
-        with open(os.path.join(out_dir, out_base_name + '.csv'), 'w') as f:
-            # header
-            f.write('# Tabulated extract PGO Hotspots data, '
-                    'by Hans Roelofsen, {0}, WEnR team B&B.\n'.format(pgo.get_timestring('full')))
-            f.write('# Query from PGO data was: {0}\n'.format(query))
-
-            # write table with soorten count per hok
-            float64cols = [k for k, v in dat_piv.dtypes.astype(str).to_dict().items() if v == 'float64']
-            f.write(dat_piv.fillna(9999).astype(dtype=dict(zip(float64cols, [np.int32]*len(float64cols)))).to_csv(sep=';', header=True, index=False))
-
+        with profiling.stage('write', snl, rows=dat_piv.shape[0]):
+            header = ['Tabulated extract PGO Hotspots data, '
+                      'by Hans Roelofsen, {0}, WEnR team B&B.'.format(pgo.get_timestring('full')),
+                      'Query from PGO data was: {0}'.format(query),
+                      'Missing values are written as {0}'.format(table_writer.sentinel)]
+            table_writer.write_table(os.path.join(out_dir, out_base_name + '.csv'), dat_piv, header)
             print('\twritten to table at {0}'.format(pgo.get_timestring('full')))
 
     if print_shp:
-        hokken = pgo.get_250m_hokken()  # geodataframe of 250m hokken
-        dat_gdf = pd.merge(left=dat_piv, right=hokken, left_on='hok_id', right_on='ID', how='inner')
-        dat_gdf = gp.GeoDataFrame(dat_gdf, crs={"init": "epsg:28992"})
-
-        dat_gdf.to_file(os.path.join(out_dir, 'shp', out_base_name + '.shp'))
-        print('\twritten to shapefile at {0}'.format(pgo.get_timestring('full')))
+        with profiling.stage('write', snl, rows=dat_piv.shape[0]):
+            hokken = pgo.get_250m_hokken()  # geodataframe of 250m hokken
+            dat_gdf = pd.merge(left=dat_piv, right=hokken, on='hok_id', how='inner')
+            dat_gdf = gp.GeoDataFrame(dat_gdf.assign(hok_id=dat_gdf['ID']), crs={"init": "epsg:28992"})
+
+            dat_gdf.to_file(os.path.join(out_dir, 'shp', out_base_name + '.shp'))
+            print('\twritten to shapefile at {0}'.format(pgo.get_timestring('full')))
+
+    if print_tif:
+        with profiling.stage('write', snl, rows=dat_piv.shape[0]):
+            tif_cols = [col for col in dat_piv.select_dtypes('number').columns if col != 'hok_id']
+            affine, shape = pgo.get_grid()
+            raster_export.write_cells_raster(dat_piv, tif_cols, os.path.join(out_dir, out_base_name + '.tif'), affine,
+                                             shape)
+            print('\twritten to GeoTIFF at {0}'.format(pgo.get_timestring('full')))
 
     if print_all_tables:
-        holder.append(dat_piv)
+        return dat_piv
+
+
+def analyse_all(obs):
+    # table of all snl types in one grouped pass, as the concatenated tables of analyse_snl. Returns None if there are
+    # no observations
+    print('\nAll {0} snl types in progress at {1}'.format(len(snl_types), pgo.get_timestring('full')))
+    query = 'snl in {0} & periode in {1} & ' \
+            'soortgroep in {2} & soortlijst in {3}'.format(snl_types, periodes, pgo.parse_soort_sel(soort), soort_lijst)
+    with profiling.stage('filter') as rec:
+        dat_sel = obs.query(query)
+        rec['rows'] = dat_sel.shape[0]
 
-if print_all_tables:
+    if dat_sel.empty:
+        print('\tNo records remaining for criteria groep={0}, '
+              'snl_types={1} and periodes={2}'.format(soort, snl_types, ', '.join([p for p in periodes])))
+        return
+    else:
+        print('\tFound {0} records complying to query'.format(dat_sel.shape[0]))
+
+    # pivot, Bijl1 totals, merge and labelling for all snl types at once
+    with profiling.stage('grouped', rows=dat_sel.shape[0]) as rec:
+        dat_out = grouped.extended_table(dat_sel, {snl: [snl] for snl in snl_types})
+        rec['rows'] = dat_out.shape[0]
+    return dat_out
 
+
+def write_all_tables(holder):
+    # write the tables of all snl types in list *holder*, as returned by analyse_snl, as one table
     dat_out = pd.concat(holder)  #note that contac adds missing columns automitcally!
 
     out_name = 'SNL-All_Srt-{0}_Lst-{1}_P{2}_{3}'.format(soort, ''.join([x for x in soort_lijst]),
@@ -152,17 +195,42 @@ if print_all_tables:
     full_query = 'snl in {0} & periode in {1} & ' \
             'soortgroep in {2} & soortlijst in {3}'.format(snl_types, periodes, pgo.parse_soort_sel(soort), soort_lijst)
 
-    with open(os.path.join(out_dir, out_name + '.csv'), 'w') as f:
-        # header
-        f.write('# Tabulated extract PGO Hotspots data, '
-                'by Hans Roelofsen, {0}, WEnR team B&B.\n'.format(pgo.get_timestring('full')))
-        f.write('# Query from PGO data was: {0}\n'.format(full_query))
+    header = ['Tabulated extract PGO Hotspots data, '
+              'by Hans Roelofsen, {0}, WEnR team B&B.'.format(pgo.get_timestring('full')),
+              'Query from PGO data was: {0}'.format(full_query)]
 
-    # write table with soorten count per hok
-        float64cols = [k for k, v in dat_piv.dtypes.astype(str).to_dict().items() if v == 'float64']
-        f.write(dat_out.fillna(9999).astype(dtype=dict(zip(float64cols, [np.int32] * len(float64cols)))).
-                to_csv(sep=';', header=True, index=False))
+    with profiling.stage('write', rows=dat_out.shape[0]):
+        # write table with soorten count per hok
+        table_writer.write_table(os.path.join(out_dir, out_name + '.csv'), dat_out,
+                                 header + ['Missing values are written as {0}'.format(table_writer.sentinel)])
+        print('\twritten to table at {0}'.format(pgo.get_timestring('full')))
 
-    print('\twritten to table at {0}'.format(pgo.get_timestring('full')))
+    if print_parquet:
+        with profiling.stage('write', rows=dat_out.shape[0]):
+            table_writer.write_parquet(os.path.join(out_dir, out_name + '.parquet'), dat_out, header)
+            print('\twritten to Parquet at {0}'.format(pgo.get_timestring('full')))
 
 
+if __name__ == '__main__':
+    if single_pass and print_all_tables and not (print_table or print_shp or print_tif):
+        # all snl types in one grouped pass, only the table of all snl types is written
+        holder = [dat_out for dat_out in [analyse_all(obs_session.ObsSession(max_mb=8000))] if dat_out is not None]
+    else:
+        obs = obs_session.ObsSession(max_mb=8000)
+        if n_workers > 1:
+            # load all observations for all snl types before the workers start, so that they share the loaded data
+            with profiling.stage('load') as rec:
+                obs.preload('periode in {0} & soortgroep in {1} & '
+                            'soortlijst in {2}'.format(periodes, pgo.parse_soort_sel(soort), soort_lijst))
+                rec['rows'] = sum(obs.units[name][0].shape[0] for name in obs.units)
+        # results are in the order of snl_types, None for snl types without observations
+        holder = [dat_piv for dat_piv in parallel.run_per_type(analyse_snl, snl_types, shared=obs,
+                                                               n_workers=n_workers) if dat_piv is not None]
+
+    if print_all_tables and holder:
+        write_all_tables(holder)
+
+    if profile_report:
+        profiling.write_report(profile_report, info={'script': 'analyse_for_extended_tab', 'snl_types': snl_types,
+                                                     'soort': soort, 'soort_lijst': soort_lijst,
+                                                     'n_workers': n_workers})
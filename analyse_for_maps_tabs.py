@@ -7,6 +7,14 @@ import pandas as pd
 import warnings
 
 from utils import pgo
+from utils import obs_session
+from utils import parallel
+from utils import render
+from utils import raster_export
+from utils import provincie
+from utils import profiling
+from utils import focal
+from utils import table_writer
 
 #======================================================================================================================#
 # define data selection and specification of difference map categories
@@ -39,17 +47,34 @@ if report_stat == 'mean' and calculate_means is False:
 # report histogram with cell count with 1, 2, 3 ... n species?
 cell_histogram = True
 
+# Getis-Ord Gi* hotspot z-score of the report_stat per periode (see utils/focal.py), within a window of radius m around
+# each cell, None for no hotspot statistic. Shape of the window: square, circle, gaussian or epanechnikov
+hotspot_radius = None  # eg. 2500
+hotspot_shape = 'circle'
+
 #======================================================================================================================#
 # specify output
 out_dir = r'd:\temptxt\test20190409'
 print_diff_map = True
 print_table = True
+print_parquet = False  # table with soorten count per hok also as Parquet file, for use in other software
 print_shp = False
+print_tif = False  # sums, means and differences per cell as multi-band GeoTIFF on the 250m grid
+print_prov_table = False  # sums and means per periode aggregated to provincie, weighted by hok fraction in provincie
+
+# number of worker processes for the snl types, 1 runs all snl types one after the other in this process
+n_workers = 1
+
+# timing and memory per stage and snl type (see utils/profiling.py) as JSON or CSV report, None for no report
+profile_report = None  # eg. os.path.join(out_dir, 'stages.json')
+profiling.profile_dir = None  # directory for a cProfile dump of the slowest stage, None for no dump
 
 #======================================================================================================================#
-# Analyse per snl type
+# Analyse per snl type. Observations are loaded once and kept in memory for all snl types, see __main__ below
 
-for snl in snl_types:
+def analyse_snl(snl):
+    # full analysis and output for a single snl type, shared ObsSession is retrieved from parallel.get_shared()
+    obs = parallel.get_shared()
 
     print('\n{0} in progress at {1}'.format(snl, pgo.get_timestring('full')))
 
@@ -65,45 +90,52 @@ for snl in snl_types:
     # formulate data query and get data
     query = 'snl in {0} & periode in {1} & ' \
             'soortgroep in {2} & soortlijst in {3}'.format(snl_list, periodes, pgo.parse_soort_sel(soort), soort_lijst)
-    dat_sel = pgo.query_all_obs(query)
+    with profiling.stage('filter', snl) as rec:  # includes loading from disk, unless preloaded
+        dat_sel = obs.query(query)
+        rec['rows'] = dat_sel.shape[0]
 
     if dat_sel.empty:
         print('\tNo records remaining for criteria groep={0}, '
               'snl_types={1} and periodes={2}'.format(soort, snl, ', '.join([p for p in periodes])))
-        continue
+        return
     else:
         print('\tFound {0} records complying to query'.format(dat_sel.shape[0]))
 
     #==================================================================================================================#
     # Pivot data around hok IDs and cap Annex 1 soorten to 2 if requested
 
-    dat_piv = pd.pivot_table(data=dat_sel, index='hok_id', columns=['periode', 'soortlijst'], values='n', aggfunc='sum')
+    with profiling.stage('pivot', snl) as rec:
+        dat_piv = obs.cube(query, dat_sel).pivot(columns=['periode', 'soortlijst'])
 
-    # Just Annex 1 data
-    annex1_dat_all = dat_piv.xs('Bijl1', level=1, axis=1)  # only annex1 data per cell
-    annex1_dat_mx2 = annex1_dat_all.where(annex1_dat_all < 2, 2)  # set to 2 where value <2 is False
+        # Just Annex 1 data
+        annex1_dat_all = dat_piv.xs('Bijl1', level=1, axis=1)  # only annex1 data per cell
+        annex1_dat_mx2 = annex1_dat_all.where(annex1_dat_all < 2, 2)  # set to 2 where value <2 is False
 
-    # Just SNL data
-    snl_dat = dat_piv.xs('SNL', level=1, axis=1)
+        # Just SNL data
+        snl_dat = dat_piv.xs('SNL', level=1, axis=1)
 
-    if annex1_dat_all.shape != snl_dat.shape and all(annex1_dat_all.index == snl_dat.index):  # double check
-        raise Exception('Somehow shapes of annex1 data and SNL data are not identical')
+        if annex1_dat_all.shape != snl_dat.shape and all(annex1_dat_all.index == snl_dat.index):  # double check
+            raise Exception('Somehow shapes of annex1 data and SNL data are not identical')
 
-    # Add either full Annex 1 data or capped Annex 1 data to the SNL data
-    if max_2_annex1_per_cell:
-        cell_dat = snl_dat.add(annex1_dat_mx2, axis=1)
-    else:
-        cell_dat = snl_dat.add(annex1_dat_all, axis=1)
+        # Add either full Annex 1 data or capped Annex 1 data to the SNL data
+        if max_2_annex1_per_cell:
+            cell_dat = snl_dat.add(annex1_dat_mx2, axis=1)
+        else:
+            cell_dat = snl_dat.add(annex1_dat_all, axis=1)
+        rec['rows'] = cell_dat.shape[0]
 
     cell_dat.rename(columns=dict(zip(periodes, ['sum_' + p for p in periodes])), inplace=True)
 
     print('\tcontaining {0} cells with observations'.format(dat_piv.shape[0]))
 
     # Join to df with count and area beheertypen per cell
-    snl_per_cell = pgo.get_snl_hokids(snl_list, 0)
-    if set(cell_dat.index) - set(snl_per_cell['hok_id']):
-        warnings.warn('\tBeware, there are cells(s) with observations, but not marked as belonging to the SNL type(s)!')
-    cell_dat = pd.merge(cell_dat, snl_per_cell, how='inner', left_index=True, right_on='hok_id')
+    with profiling.stage('merge', snl) as rec:
+        snl_per_cell = pgo.get_snl_hokids(snl_list, 0)
+        if set(cell_dat.index) - set(snl_per_cell['hok_id']):
+            warnings.warn('\tBeware, there are cells(s) with observations, but not marked as belonging to the SNL '
+                          'type(s)!')
+        cell_dat = pd.merge(cell_dat, snl_per_cell, how='inner', left_index=True, right_on='hok_id')
+        rec['rows'] = cell_dat.shape[0]
 
     # clean-up
     del snl_per_cell, dat_piv, dat_sel, snl_dat, annex1_dat_all, annex1_dat_mx2
@@ -114,20 +146,32 @@ for snl in snl_types:
     # calculate species count DIVIDED BY beheertype count, per periode, if requested
     if calculate_means:
         for periode in periodes:
-            cell_dat['mean_{0}'.format(periode)] = cell_dat.apply(lambda row: np.divide(row['sum_{0}'.format(periode)],
-                                                                                        row['snl_count']), axis=1)
+            cell_dat['mean_{0}'.format(periode)] = np.divide(cell_dat['sum_{0}'.format(periode)], cell_dat['snl_count'])
 
     # Difference in sp count per cell between two periods. Calculate for the requested reporting stat
     if calculate_differences:
-        report_col_names = [report_stat + '_' + p for p in diff_periodes]
-        cell_dat.dropna(axis=0, how='any', subset=report_col_names, inplace=True)  # drop NAs, ie cells w/o obs in a period
-        cell_dat['sp_count_diff'] = cell_dat.apply(lambda row: np.subtract(row[report_col_names[1]],
-                                                                           row[report_col_names[0]]), axis=1)
-        cell_dat['diff_cat'] = cell_dat['sp_count_diff'].apply(pgo.classifier, args=(diff_cats, diff_labs))
-
-        # histogram of period differences
-        diff_piv = pd.pivot_table(data=cell_dat, index='sp_count_diff', values=report_col_names[0], aggfunc='count')
-        diff_piv.rename(columns={report_col_names[0]: 'count'}, inplace=True)
+        with profiling.stage('classify', snl, rows=cell_dat.shape[0]):
+            report_col_names = [report_stat + '_' + p for p in diff_periodes]
+            # drop NAs, ie cells w/o obs in a period
+            cell_dat.dropna(axis=0, how='any', subset=report_col_names, inplace=True)
+            cell_dat['sp_count_diff'] = np.subtract(cell_dat[report_col_names[1]], cell_dat[report_col_names[0]])
+            cell_dat['diff_cat'] = pgo.classify(cell_dat['sp_count_diff'], diff_cats, diff_labs)
+
+            # histogram of period differences
+            diff_piv = pd.pivot_table(data=cell_dat, index='sp_count_diff', values=report_col_names[0],
+                                      aggfunc='count')
+            diff_piv.rename(columns={report_col_names[0]: 'count'}, inplace=True)
+
+    # hotspot z-score per cell and periode, relative to the other cells of the snl type
+    if hotspot_radius:
+        with profiling.stage('hotspot', snl, rows=cell_dat.shape[0]):
+            for periode in periodes:
+                col = '{0}_{1}'.format(report_stat, periode)
+                if col in cell_dat.columns and cell_dat[col].notna().sum() > 1:
+                    valid = cell_dat[col].notna()
+                    cell_dat.loc[valid, 'gi_{0}'.format(periode)] = focal.gi_star_cells(
+                        cell_dat.loc[valid, 'hok_id'].values, cell_dat.loc[valid, col].values, hotspot_radius,
+                        hotspot_shape)
 
     # histogram of cell-count with X species in them, per periode
     if cell_histogram:
@@ -144,17 +188,17 @@ for snl in snl_types:
                 continue
         cells_hist.dropna(axis=0, how='all', inplace=True)  # Drop rows without values
 
-    if print_diff_map or print_shp:
+    if print_shp:
         # create geospatial object if needed
         hokken = pgo.get_250m_hokken()  # geodataframe of 250m hokken
 
         # merge to the geodataframe to get a spatial object
-        hok_comparison = set(cell_dat['hok_id']) - set(hokken['ID'])  # set of stuff in dat_piv.index BUT NOT IN hokken['id']
+        hok_comparison = set(cell_dat['hok_id']) - set(hokken['hok_id'])  # set of stuff in dat_piv.index BUT NOT IN hokken
         if hok_comparison:
             raise Exception('{0} 250m hokken zijn bekend in de database, maar niet in de '
-                            'shapefile: {1}'.format(len(hok_comparison), '\n'.join([str(hok) for hok in hok_comparison])))
+                            'shapefile: {1}'.format(len(hok_comparison), '\n'.join(pgo.hok_id_to_str(list(hok_comparison)))))
 
-        cell_gdf = pd.merge(left=hokken, right=cell_dat, how='inner', left_on='ID', right_on='hok_id')
+        cell_gdf = pd.merge(left=hokken, right=cell_dat, how='inner', on='hok_id')
 
     #==================================================================================================================#
     # Generate output as requested
@@ -165,48 +209,102 @@ for snl in snl_types:
                                                              pgo.get_timestring('brief'))
 
     if print_diff_map and calculate_differences:
-        map_title = 'Toe/Afname van {0} ' \
-                    'aantal {1} in {2}\n gedurende {3}'.format(report_stat,
-                                                               ', '.join([s for s in pgo.parse_soort_sel(soort)]),
-                                                               snl, ':'.join([x for x in labels]))
-        pgo.diff_to_png(gdf=cell_gdf, col='diff_cat', cats=diff_labs, cat_cols=dict(zip(diff_labs, diff_colors)),
-                        title=map_title, background=False, background_cells=hokken, out_dir=out_dir,
-                        out_name=out_base_name + '.png',
-                        comment='Created Hans Roelofsen WEnR at {0}'.format(pgo.get_timestring('full')))
-        print('\tprinted to map at {0}'.format(pgo.get_timestring('full')))
+        with profiling.stage('render', snl, rows=cell_dat.shape[0]):
+            map_title = 'Toe/Afname van {0} ' \
+                        'aantal {1} in {2}\n gedurende {3}'.format(report_stat,
+                                                                   ', '.join([s for s in pgo.parse_soort_sel(soort)]),
+                                                                   snl, ':'.join([x for x in labels]))
+            render.diff_to_png(df=cell_dat, col='diff_cat', cats=diff_labs, cat_cols=dict(zip(diff_labs, diff_colors)),
+                               title=map_title, out_dir=out_dir, out_name=out_base_name + '.png',
+                               comment='Created Hans Roelofsen WEnR at {0}'.format(pgo.get_timestring('full')))
+            print('\tprinted to map at {0}'.format(pgo.get_timestring('full')))
 
     if print_shp:
-        cell_gdf.to_file(os.path.join(out_dir, 'shp', out_base_name + '.shp'))
-        print('\twritten to shapefile at {0}'.format(pgo.get_timestring('full')))
+        with profiling.stage('write', snl, rows=cell_dat.shape[0]):
+            cell_gdf.assign(hok_id=cell_gdf['ID']).to_file(os.path.join(out_dir, 'shp', out_base_name + '.shp'))
+            print('\twritten to shapefile at {0}'.format(pgo.get_timestring('full')))
+
+    if print_prov_table:
+        with profiling.stage('write', snl, rows=cell_dat.shape[0]):
+            holder = []
+            for periode in periodes:
+                try:
+                    prov_stats = provincie.zonal_stats(cell_dat['hok_id'], cell_dat['sum_{0}'.format(periode)])
+                    holder.append(prov_stats.add_suffix('_{0}'.format(periode)))
+                except KeyError:  # a period may be absent if there are no observations
+                    continue
+            prov_table = pd.concat(holder, axis=1)
+            int_cols = [col for col in prov_table.columns if col.startswith(('sum_', 'count_'))]
+            prov_table[int_cols] = prov_table[int_cols].round().astype(np.int64)
+            table_writer.write_table(os.path.join(out_dir, out_base_name + '_prov.csv'), prov_table,
+                                     header_lines=['Provincie totals of PGO Hotspots data, by Hans Roelofsen, {0}, '
+                                                   'WEnR team B&B.'.format(pgo.get_timestring('full')),
+                                                   'Query from PGO data was: {0}'.format(query),
+                                                   'Hokken crossing a provincie border count with their area '
+                                                   'fraction in each provincie, sums and counts are rounded',
+                                                   'Missing values are written as {0}'.format(table_writer.sentinel)],
+                                     index=True)
+            print('\twritten to provincie table at {0}'.format(pgo.get_timestring('full')))
+
+    if print_tif:
+        with profiling.stage('write', snl, rows=cell_dat.shape[0]):
+            tif_cols = [col for col in cell_dat.columns if col.startswith(('sum_', 'mean_', 'gi_'))
+                        or col in ['snl_count', 'snl_area_m2', 'sp_count_diff', 'diff_cat']]
+            affine, shape = pgo.get_grid()
+            raster_export.write_cells_raster(cell_dat, tif_cols, os.path.join(out_dir, out_base_name + '.tif'), affine,
+                                             shape)
+            print('\twritten to GeoTIFF at {0}'.format(pgo.get_timestring('full')))
+
+    # header lines of table outputs
+    header = ['Tabulated extract PGO Hotspots data, '
+              'by Hans Roelofsen, {0}, WEnR team B&B.'.format(pgo.get_timestring('full')),
+              'Query from PGO data was: {0}'.format(query)]
+    if max_2_annex1_per_cell:
+        header.append('Bijlage 1 soorten were capped to 2 per cell')
+    if calculate_differences:
+        header.append('Difference statistics are derived from the {0} columns '
+                      'between periodes {1} and {2}.'.format(report_stat, diff_periodes[0], diff_periodes[1]))
+    if hotspot_radius:
+        header.append('gi_ columns are Getis-Ord Gi* z-scores of the {0} columns in a {1} window of radius {2} m'
+                      .format(report_stat, hotspot_shape, hotspot_radius))
+
+    if print_parquet:
+        with profiling.stage('write', snl, rows=cell_dat.shape[0]):
+            table_writer.write_parquet(os.path.join(out_dir, out_base_name + '.parquet'), cell_dat, header)
+            print('\twritten to Parquet at {0}'.format(pgo.get_timestring('full')))
 
     if print_table:
-        with open(os.path.join(out_dir, out_base_name + '.csv'), 'w') as f:
-            f.write('# Tabulated extract PGO Hotspots data, '
-                    'by Hans Roelofsen, {0}, WEnR team B&B.\n'.format(pgo.get_timestring('full')))
-            f.write('# Query from PGO data was: {0}\n'.format(query))
-
-            if max_2_annex1_per_cell:
-                f.write('# Bijlage 1 soorten were capped to 2 per cell\n')
-
-            if calculate_differences:
-                f.write('# Difference statistics are derived from the {0} columns'
-                        'between periodes {1} and {2}.\n'.format(report_stat, diff_periodes[0], diff_periodes[1]))
-
-            # write table with soorten count per hok
-            float64cols = [k for k,v in cell_dat.dtypes.astype(str).to_dict().items() if v == 'float64']
-            f.write(cell_dat.fillna(9999).astype(dtype=dict(zip(float64cols, [np.int32]*len(float64cols)))).to_csv(sep=';', header=True, index=False))
-
-            if calculate_differences:
-                # write table with histogram differences count between periodes
-                f.write('######\n')
-                float64cols = [k for k,v in cell_dat.dtypes.astype(str).to_dict().items() if v == 'float64']
-                # TODO: write as integers, not floats
-                f.write(diff_piv.fillna(9999).to_csv(sep=';', header=True, index=True))
-
-            if cell_histogram:
-                f.write('######\n')
-                float64cols = [k for k,v in cell_dat.dtypes.astype(str).to_dict().items() if v == 'float64']
-                # TODO: write as integers, not floats
-                f.write(cells_hist.fillna(9999).to_csv(sep=';', header=True, index=True))
-
-            print('\twritten to table at {0}'.format(pgo.get_timestring('full')))
+        with profiling.stage('write', snl, rows=cell_dat.shape[0]):
+            with open(os.path.join(out_dir, out_base_name + '.csv'), 'w') as f:
+                table_writer.write_header(f, header + ['Missing values are written as {0}'.format(
+                    table_writer.sentinel)])
+
+                # write table with soorten count per hok
+                table_writer.write_csv(f, cell_dat)
+
+                if calculate_differences:
+                    # write table with histogram differences count between periodes
+                    f.write('######\n')
+                    table_writer.write_csv(f, diff_piv, index=True)
+
+                if cell_histogram:
+                    f.write('######\n')
+                    table_writer.write_csv(f, cells_hist, index=True)
+
+                print('\twritten to table at {0}'.format(pgo.get_timestring('full')))
+
+
+if __name__ == '__main__':
+    obs = obs_session.ObsSession(max_mb=8000)
+    if n_workers > 1:
+        # load all observations for all snl types before the workers start, so that they share the loaded data
+        with profiling.stage('load') as rec:
+            obs.preload('periode in {0} & soortgroep in {1} & '
+                        'soortlijst in {2}'.format(periodes, pgo.parse_soort_sel(soort), soort_lijst))
+            rec['rows'] = sum(obs.units[name][0].shape[0] for name in obs.units)
+    parallel.run_per_type(analyse_snl, snl_types, shared=obs, n_workers=n_workers)
+
+    if profile_report:
+        profiling.write_report(profile_report, info={'script': 'analyse_for_maps_tabs', 'snl_types': snl_types,
+                                                     'soort': soort, 'soort_lijst': soort_lijst,
+                                                     'n_workers': n_workers})
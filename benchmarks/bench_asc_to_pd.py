@@ -0,0 +1,75 @@
+# Benchmark of the ascii grid -> pandas dataframe conversion in utils/pgo.py, per-file conversion time before and after
+# vectorisation. Writes a synthetic ascii grid with the national 250m extent to a temporary directory.
+# Run from the repository root: python -m benchmarks.bench_asc_to_pd
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import os
+import shutil
+import tempfile
+import timeit
+import numpy as np
+import pandas as pd
+import rasterio as rio
+
+from utils import grid
+from utils import pgo
+
+#======================================================================================================================#
+# benchmark settings
+ncols, nrows = 1120, 1300  # 280 km x 325 km at 250m, ie. the full extent of the PGO grids
+xllcorner, yllcorner, cellsize = 0, 300000, 250
+fill_fraction = 0.10  # fraction of cells with species
+repeat = 3
+run_legacy = True  # the legacy conversion takes minutes on the full extent
+
+
+def write_synthetic_asc(dir_out, asc_out, seed=0):
+    # write ascii grid with NoData border and sparse non-zero species counts
+    rng = np.random.default_rng(seed)
+    vals = np.where(rng.random((nrows, ncols)) < fill_fraction, rng.integers(1, 60, (nrows, ncols)), 0)
+    vals[rng.random((nrows, ncols)) < 0.3] = -9999
+    vals[:, 0] = -9999  # every data line must start with NoData, see pgo.get_specs
+    with open(os.path.join(dir_out, asc_out), 'w') as f:
+        f.write('NCOLS {0}\nNROWS {1}\nXLLCORNER {2}\nYLLCORNER {3}\nCELLSIZE {4}\nNODATA_value -9999\n'
+                .format(ncols, nrows, xllcorner, yllcorner, cellsize))
+        np.savetxt(f, vals, fmt='%d', delimiter=' ')
+
+
+def legacy_ascii_species_grid_to_pd(dir_in, asc_in):
+    # ascii_species_grid_to_pd as it was before vectorisation, with per-row apply on the affine
+    groep, snl, soortlijst, periode = os.path.splitext(asc_in)[0].split('_')
+    specs = pgo.get_specs(dir_in, asc_in)
+    asc = rio.open(os.path.join(dir_in, asc_in))
+    vals = np.reshape(asc.read(1), np.prod(asc.shape), order='C').astype(np.int16)
+    db = pd.DataFrame({'n': vals, 'soortgroep': groep, 'snl': snl, 'periode': periode, 'soortlijst': soortlijst})
+    db['row'] = np.array([[i] * specs['NCOLS'] for i in range(0, specs['NROWS'])]).reshape(np.prod(asc.shape))
+    db['col'] = np.array([i for i in range(0, specs['NCOLS'])] * specs['NROWS']).reshape(np.prod(asc.shape))
+    db.drop(db.loc[(db['n'] == specs['NODATA_value']) | (db['n'] == 0)].index, axis=0, inplace=True)
+    db['x_rd'] = db.apply(lambda x: (asc.transform * (x.col, x.row))[0], axis=1).astype(np.int32)
+    db['y_rd'] = db.apply(lambda x: (asc.transform * (x.col, x.row))[1], axis=1).astype(np.int32)
+    db['hok_id'] = db.apply(lambda x: str(x.x_rd) + '_' + str(x.y_rd), axis=1)
+    return db
+
+
+if __name__ == '__main__':
+    tmp_dir = tempfile.mkdtemp()
+    asc_name = 'vogel_N1705_SNL_2010-2017.asc'
+    try:
+        write_synthetic_asc(tmp_dir, asc_name)
+        print('Synthetic grid {0} x {1} written at {2}'.format(nrows, ncols, pgo.get_timestring('full')))
+
+        new = pgo.ascii_species_grid_to_pd(tmp_dir, asc_name)
+        t_new = min(timeit.repeat(lambda: pgo.ascii_species_grid_to_pd(tmp_dir, asc_name), number=1, repeat=repeat))
+        print('\tvectorised: {0:.3f} s per file, {1} rows'.format(t_new, new.shape[0]))
+
+        if run_legacy:
+            old = legacy_ascii_species_grid_to_pd(tmp_dir, asc_name)
+            t_old = min(timeit.repeat(lambda: legacy_ascii_species_grid_to_pd(tmp_dir, asc_name), number=1, repeat=1))
+            print('\tlegacy:     {0:.3f} s per file, {1} rows'.format(t_old, old.shape[0]))
+            print('\tspeed-up:   {0:.0f}x'.format(t_old / t_new))
+
+            # double check that both give identical output, with the legacy x_y hok_id as the integer hok_id
+            old['hok_id'] = grid.encode(old['x_rd'], old['y_rd'])
+            pd.testing.assert_frame_equal(old[list(new)], new, check_dtype=False)
+    finally:
+        shutil.rmtree(tmp_dir)
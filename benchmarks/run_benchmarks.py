@@ -0,0 +1,141 @@
+# Benchmark suite for the PGO pipeline on synthetic data (see benchmarks/synthetic.py). Times grid conversion, the
+# observation queries, pivots, get_snl_hokids, classification and map rendering, and writes the results as JSON so
+# that runs can be compared over time.
+# Run from the repository root, eg.: python -m benchmarks.run_benchmarks --obs-rows 36000000
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import matplotlib
+matplotlib.use('Agg')  # no screen needed for map rendering
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from utils import pgo
+from utils import asc_convert
+from utils import obs_store
+from utils import obs_session
+from utils import cube
+from utils import mesh
+from utils import provincie
+from utils import render
+from utils import snl_matrix
+
+
+def timed(results, name, func, repeat=3, rows=None):
+    # run *func* *repeat* times and append the timings to *results*, returns the output of the last run
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func()
+        times.append(time.perf_counter() - t0)
+    results.append({'name': name, 'seconds_min': min(times), 'seconds_mean': float(np.mean(times)), 'repeat': repeat,
+                    'rows': rows if rows is not None else (len(out) if hasattr(out, '__len__') else None)})
+    print('{0:<32} {1:>9.3f} s'.format(name, min(times)))
+    return out
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(work_dir, obs_rows, n_grids, repeat):
+    results = []
+    query = "snl in ['N1705'] & periode in {0} & soortgroep in ['vogel', 'vlinder', 'vaatplant'] & " \
+            "soortlijst in ['SNL', 'Bijl1']".format(synthetic.periodes)
+
+    # synthetic data, and point the hard-coded locations in utils to it
+    grid_dir, snl_dir = os.path.join(work_dir, 'grids'), os.path.join(work_dir, 'snl')
+    os.makedirs(grid_dir)
+    os.makedirs(snl_dir)
+    grids = synthetic.write_species_grids(grid_dir, n_grids)
+    snl_grids = synthetic.write_snl_grids(snl_dir)
+    pgo.obs_sources = synthetic.write_obs_tables(work_dir, obs_rows)
+    pgo.obs_store_dir = os.path.join(work_dir, 'obs_store')
+    snl_matrix.snl_matrix_path = os.path.join(work_dir, 'snl_matrix.npz')
+    provincie.prov_index_dir = work_dir
+    render.prov_shp = render.prov_grenzen_shp = os.path.join(work_dir, 'provincies.shp')
+    render.backdrop_cache = os.path.join(work_dir, 'backdrop.npz')
+    prov = synthetic.write_provincies(render.prov_shp)
+    print('synthetic data with {0} observations written at {1}'.format(obs_rows, pgo.get_timestring('full')))
+
+    # grid conversion
+    timed(results, 'ascii_species_grid_to_pd', lambda: pgo.ascii_species_grid_to_pd(grid_dir, grids[0]), repeat)
+    timed(results, 'asc_convert.convert_dir', lambda: asc_convert.convert_dir(
+        grid_dir, grids, os.path.join(grid_dir, 'bin'), 'species', n_workers=min(len(grids), os.cpu_count())), 1,
+        rows=len(grids))
+
+    # SNL matrix, provincie index and get_snl_hokids
+    asc_convert.convert_dir(snl_dir, snl_grids, os.path.join(snl_dir, 'bin'), 'snl')
+    timed(results, 'snl_matrix.build_snl_matrix', lambda: snl_matrix.build_snl_matrix(os.path.join(snl_dir, 'bin')),
+          1, rows=len(snl_grids))
+    cell, zone, fraction = mesh.zone_fractions(prov, synthetic.affine, (synthetic.nrows, synthetic.ncols))
+    lookup = mesh.zone_table(cell, zone, fraction, prov, 'PROVC_NM', synthetic.affine, synthetic.ncols)
+    provincie.save_prov_index(lookup['hok_id'].values, zone, fraction, prov['PROVC_NM'].values)
+    snl_per_cell = timed(results, 'get_snl_hokids', lambda: pgo.get_snl_hokids(['N1705', 'N1402'], 0), repeat)
+
+    # observation queries: csv, obs store and session
+    dat_sel = timed(results, 'query_all_obs csv', lambda: pgo.query_all_obs(query), 1)
+    timed(results, 'obs_store.build_obs_store', lambda: obs_store.build_obs_store(pgo.obs_sources, pgo.obs_store_dir),
+          1, rows=obs_rows)
+    timed(results, 'query_all_obs obs store', lambda: pgo.query_all_obs(query), repeat)
+    session = obs_session.ObsSession()
+    timed(results, 'ObsSession.query first', lambda: session.query(query), 1)
+    timed(results, 'ObsSession.query repeated', lambda: session.query(query), repeat)
+
+    # pivots
+    cols = ['periode', 'soortgroep', 'soortlijst']
+    timed(results, 'pd.pivot_table', lambda: pd.pivot_table(data=dat_sel, index='hok_id', columns=cols, values='n',
+                                                            aggfunc='sum', dropna=False), repeat, rows=len(dat_sel))
+    timed(results, 'ObsCube.pivot', lambda: cube.ObsCube(dat_sel).pivot(columns=cols, dropna=False), repeat,
+          rows=len(dat_sel))
+
+    # classification of differences
+    diff_cats = [range(-1000, -4), range(-4, 0), range(0, 1), range(1, 5), range(5, 1000)]
+    diff_labs = ['-5 or less', '-4 t/m -1', '0', '1 t/m 4', '5 or more']
+    diffs = pd.Series(np.random.default_rng(0).integers(-50, 50, 1000000))
+    timed(results, 'classifier apply (10k)', lambda: diffs[:10000].apply(pgo.classifier, args=(diff_cats, diff_labs)),
+          1)
+    cats = timed(results, 'classify (1M)', lambda: pgo.classify(diffs, diff_cats, diff_labs), repeat)
+
+    # map rendering
+    df = pd.DataFrame({'hok_id': snl_per_cell['hok_id'].values,
+                       'diff_cat': cats[:len(snl_per_cell)]})
+    colors = dict(zip(diff_labs, ['red', 'orange', 'lightgrey', 'lightgreen', 'darkgreen']))
+    timed(results, 'render.diff_to_png', lambda: render.diff_to_png(df, 'benchmark', '', 'diff_cat', diff_labs, colors,
+                                                                    work_dir, 'map.png'), repeat, rows=len(df))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the PGO pipeline on synthetic data')
+    parser.add_argument('--obs-rows', type=int, default=1000000, help='total observation rows, 36000000 is real scale')
+    parser.add_argument('--grids', type=int, default=4, help='number of species grids to convert')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', default=os.path.join('benchmarks', 'results'), help='directory for the JSON results')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        results = run(work_dir, args.obs_rows, args.grids, args.repeat)
+    finally:
+        shutil.rmtree(work_dir)
+
+    report = {'created': pgo.get_timestring('full'), 'commit': git_commit(), 'python': platform.python_version(),
+              'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.node(), 'cpu_count': os.cpu_count(),
+              'obs_rows': args.obs_rows, 'grids': args.grids, 'results': results}
+    os.makedirs(args.out, exist_ok=True)
+    out_file = os.path.join(args.out, 'bench_{0}.json'.format(pgo.get_timestring('brief')))
+    with open(out_file, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('results written to {0}'.format(out_file))
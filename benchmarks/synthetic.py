@@ -0,0 +1,108 @@
+# Synthetic PGO data for benchmarking: ascii grids on the national 250m extent (sparse non-zero cells, NoData outside
+# a land mask), observation tables in the format of pgo.obs_sources at configurable scale, SNL grids and provincies.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gp
+import shapely
+from rasterio.transform import Affine
+
+from utils import grid
+
+# national extent of the 250m grid, identical to grid.national_affine
+ncols, nrows, xllcorner, yllcorner, cellsize = 1200, 1400, 0, 300000, 250
+affine = Affine(cellsize, 0, xllcorner, 0, -cellsize, yllcorner + nrows * cellsize)
+
+periodes = ['1994-2001', '2002-2009', '2010-2017']
+snl_types = ['N0601', 'N0701', 'N1002', 'N1201', 'N1402', 'N1705']
+soortlijsten = ['SNL', 'Bijl1', 'VHR', 'EcoSysLijst']
+
+# share of each source in the observation rows, as in the real data (32.4M vogel, 2.8M plant, 0.8M vlinder)
+source_shares = {'vlinder': 0.022, 'plant_snl': 0.02, 'plant_bijl1': 0.02, 'plant_vhr': 0.02, 'plant_eco': 0.018,
+                 'vogel': 0.90}
+source_groep = {'vlinder': 'vlinder', 'plant_snl': 'vaatplant', 'plant_bijl1': 'vaatplant',
+                'plant_vhr': 'vaatplant', 'plant_eco': 'vaatplant', 'vogel': 'vogel'}
+source_lijst = {'plant_snl': ['SNL'], 'plant_bijl1': ['Bijl1'], 'plant_vhr': ['VHR'], 'plant_eco': ['EcoSysLijst']}
+
+
+def land_mask():
+    # boolean array of cells on 'land': an ellipse covering about 60% of the extent, never the first column
+    row, col = np.indices((nrows, ncols))
+    mask = ((row - nrows / 2) / (nrows * 0.48)) ** 2 + ((col - ncols / 2) / (ncols * 0.48)) ** 2 < 1
+    mask[:, 0] = False
+    return mask
+
+
+def land_hok_ids():
+    # integer hok_ids of all land cells
+    row, col = np.nonzero(land_mask())
+    return grid.rowcol_to_hok_id(affine, row, col)
+
+
+def write_asc(dir_out, asc_out, vals, nodata=-9999):
+    with open(os.path.join(dir_out, asc_out), 'w') as f:
+        f.write('NCOLS {0}\nNROWS {1}\nXLLCORNER {2}\nYLLCORNER {3}\nCELLSIZE {4}\nNODATA_value {5}\n'
+                .format(ncols, nrows, xllcorner, yllcorner, cellsize, nodata))
+        np.savetxt(f, vals, fmt='%d', delimiter=' ')
+
+
+def write_species_grids(dir_out, n_grids, fill_fraction=0.1, seed=0):
+    # write *n_grids* species count grids named <groep>_<snl>_<soortlijst>_<periode>.asc, returns the file names
+    rng = np.random.default_rng(seed)
+    mask = land_mask()
+    names = []
+    for i in range(n_grids):
+        name = 'vogel_{0}_{1}_{2}.asc'.format(snl_types[i % len(snl_types)],
+                                              soortlijsten[(i // len(snl_types)) % 2], periodes[i % len(periodes)])
+        vals = np.where(rng.random((nrows, ncols)) < fill_fraction, rng.integers(1, 60, (nrows, ncols)), 0)
+        write_asc(dir_out, name, np.where(mask, vals, -9999))
+        names.append(name)
+    return names
+
+
+def write_snl_grids(dir_out, fill_fraction=0.05, seed=1):
+    # write one SNL area grid per snl type, area in m2 between 1 and 62500
+    rng = np.random.default_rng(seed)
+    mask = land_mask()
+    for snl in snl_types:
+        vals = np.where(rng.random((nrows, ncols)) < fill_fraction, rng.integers(1, 62501, (nrows, ncols)), 0)
+        write_asc(dir_out, snl + '.asc', np.where(mask, vals, -9999))
+    return [snl + '.asc' for snl in snl_types]
+
+
+def write_obs_tables(dir_out, n_rows, seed=2, chunksize=1000000):
+    # write semicolon separated observation tables with *n_rows* rows in total, divided over the sources as in the
+    # real data. Written in chunks, so any scale up to the full 36M rows fits in memory. Returns {source: file}
+    rng = np.random.default_rng(seed)
+    hok_ids = land_hok_ids()
+    sources = {}
+    for source, share in source_shares.items():
+        path = os.path.join(dir_out, source + '.csv')
+        todo = int(n_rows * share)
+        with open(path, 'w') as f:
+            f.write('# synthetic PGO observations for benchmarking\n')
+            first = True
+            while todo > 0 or first:
+                size = min(todo, chunksize)
+                lijsten = source_lijst.get(source, ['SNL', 'Bijl1', 'VHR', 'EcoSysLijst'])
+                pd.DataFrame({'periode': rng.choice(periodes, size), 'snl': rng.choice(snl_types, size),
+                              'n': rng.integers(1, 40, size), 'hok_id': rng.choice(hok_ids, size),
+                              'soortlijst': rng.choice(lijsten, size), 'soortgroep': source_groep[source]}
+                             ).to_csv(f, sep=';', header=first, index=False)
+                todo -= size
+                first = False
+        sources[source] = path
+    return sources
+
+
+def write_provincies(path, n=12):
+    # write shapefile of *n* vertical strips over the extent, as stand-in for the provincies, with name column PROVC_NM
+    xmax = xllcorner + ncols * cellsize
+    edges = np.linspace(xllcorner, xmax, n + 1)
+    geoms = [shapely.box(x0, yllcorner, x1, yllcorner + nrows * cellsize) for x0, x1 in zip(edges[:-1], edges[1:])]
+    prov = gp.GeoDataFrame({'PROVC_NM': ['prov{0:02d}'.format(i) for i in range(n)]}, geometry=geoms,
+                           crs='EPSG:28992')
+    prov.to_file(path)
+    return prov
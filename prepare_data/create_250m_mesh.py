@@ -1,56 +1,51 @@
 # script to create 250 m mesh polygon shapefile based on top-left coordinates
 # Hans Roelofsen, WEnR, 20/03/1019
+#
+# All cell polygons are generated in bulk from the grid of an example ascii grid (see utils/grid.py). Each cell gets
+# the provincie that covers the largest part of it, from rasterizing the provincies on the same grid. For cells
+# crossing a provincie border, the fraction per provincie is written to a separate table. The complete hok <->
+# provincie lookup with fractions is stored as versioned arrays for utils/provincie.py. See utils/mesh.py
 
-import os
-import numpy as np
 import geopandas as gp
-import rasterio as rio
-from shapely import geometry
-import pandas as pd
+import numpy as np
 
+from utils import grid
 from utils import pgo
+from utils import mesh
+from utils import provincie
 
-def create_250m_hok(xy):
-    # return X,Y coordinates of 125m sided square with vertices (a, b, c, d), clockwise starting from point a, topleft
-    # input xy must be x, y of vertex a, ie. topleft point, so that:
-    # vertex a: xmin, ymax
-    # vertex b: xmax, ymax
-    # vertex c: xmax, ymin
-    # vertex d: xmin, ymin
-
-    xtopleft, ytopleft = xy
-    xmin, xmax = xtopleft, xtopleft + 250
-    ymin, ymax = ytopleft - 250, ytopleft
-    return [(xmin, ymax), (xmax, ymax), (xmax, ymin), (xmin, ymin)]
+grid_dir, grid_asc = r'd:\hotspot_working\a_broedvogels\SNL_grids', 'Heide.asc'  # Example ASCII dataset
+prov_shp = r'd:\NL\provincies_2018\poly\provincies_2018.shp'
+prov_col = 'PROVC_NM'  # attribute with provincie name
+out_dir = r'd:\hotspot_working\shp_250mgrid'
 
+affine, shape = grid.from_asc(grid_dir, grid_asc)
 
-asc = rio.open(os.path.join(r'd:\hotspot_working\a_broedvogels\SNL_grids', 'Heide.asc'))  #Example ASCII dataset
-specs = pgo.get_specs(r'd:\hotspot_working\a_broedvogels\SNL_grids', 'Heide.asc')
-vals = np.reshape(asc.read(1), newshape=np.product(asc.shape), order='C').astype(np.int32)
-
-db = pd.DataFrame({'hok': vals})
-db['row'] = np.array([[i] * specs['NCOLS'] for i in range(0, specs['NROWS'])]).reshape(np.product(asc.shape))
-db['col'] = np.array([i for i in range(0, specs['NCOLS'])] * specs['NROWS']).reshape(np.product(asc.shape))
 # note that coordinates are calculated for the row,col indices, which means they apply to the cell top-left!
-db['x_rd'] = db.apply(lambda x: ((x.col, x.row) * asc.affine)[0], axis=1).astype(np.int32)
-db['y_rd'] = db.apply(lambda x: ((x.col, x.row) * asc.affine)[1], axis=1).astype(np.int32)
+x_rd, y_rd = mesh.cell_topleft(affine, shape)
 
+hok250 = gp.GeoDataFrame({'topleftx': x_rd, 'toplefty': y_rd},
+                         geometry=mesh.cell_polygons(x_rd, y_rd, affine.a), crs={"init": "epsg:28992"})
+hok250['hok_id'] = grid.rowcol_to_hok_id(affine, *grid.all_cells(shape))
+hok250['ID'] = pgo.hok_id_to_str(hok250['hok_id'])  # string form for the shapefile only
 
-hok250 = gp.GeoDataFrame(crs={"init": "epsg:28992"})
-hok250['topleftx'] = db['x_rd']
-hok250['toplefty'] = db['y_rd']
-hok250['geometry'] = hok250.apply(lambda row: geometry.Polygon(create_250m_hok((row['topleftx'], row['toplefty']))),
-                                  axis=1)
-hok250['ID'] = hok250.apply(lambda row: '{0}_{1}'.format(row['topleftx'], row['toplefty']), axis=1)
+# rasterize provincies on the 250m grid and assign the dominant provincie to each hok
+prov = gp.read_file(prov_shp)
+cell, zone, fraction = mesh.zone_fractions(prov, affine, shape)
+dominant = mesh.dominant_zone(cell, zone, fraction, hok250.shape[0])
+hok250[prov_col] = np.where(dominant >= 0, prov[prov_col].values[dominant], None)
 
-# read provincies and join to the hokken
-prov = gp.read_file(r'd:\NL\provincies_2018\poly\provincies_2018.shp')
+# fraction per provincie for the cells crossing a provincie border
+border = mesh.border_fractions(cell, zone, fraction)
+hok_prov_border = mesh.zone_table(cell[border], zone[border], fraction[border], prov, prov_col, affine, shape[1])
 
-hok_prov = gp.sjoin(left_df=hok250, right_df=prov, op='intersects', how='left')
+# versioned hok <-> provincie lookup, see provincie.prov_version
+lookup = mesh.zone_table(cell, zone, fraction, prov, prov_col, affine, shape[1])
+provincie.save_prov_index(lookup['hok_id'].values, zone, fraction, prov[prov_col].values)
 
-print(hok_prov.head())
-print(hok_prov.shape)
+print(hok250.head())
 print(hok250.shape)
+print('{0} hokken cross a provincie border'.format(hok_prov_border['hok_id'].nunique()))
 
-
-# hok_prov.to_file(r'd:\hotspot_working\shp_250mgrid\hok250m_fullextent.shp')
+# hok250.to_file(os.path.join(out_dir, 'hok250m_fullextent.shp'))
+# hok_prov_border.to_pickle(os.path.join(out_dir, 'hok250m_prov_border_fractions.pkl'))
@@ -1,69 +1,103 @@
 # Script to convert ASCII grid data to database format. Used for PLANT and VOGEL data
 # Hans Roelofsen, WEnR, 25/03/2019
+#
+# All grids are first converted concurrently to compact binary per-grid files (sparse cell index + counts) in a 'bin'
+# subdirectory with a manifest.json, see utils/asc_convert.py. The tables read by pgo are written from these, grid by
+# grid, so that peak memory stays at the size of a single grid.
+#
+# With incremental = True, only grids that are new or changed since the previous run (by size, mtime and content hash
+# as recorded in the manifest) are converted, and only the tables, obs store partitions and SNL matrix that depend on
+# them are rewritten.
 
 
 import os
-import pandas as pd
-import datetime
-import pickle
 import geopandas as gp
 
 from utils import pgo
+from utils import asc_convert
+from utils import obs_store
+from utils import snl_matrix
+
+n_workers = 8  # number of grids converted concurrently
+incremental = True  # False reconverts all grids
 
-# Run for all ascii files in vaatplanten
 vaatplant_dir = r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom'
-i = 0
-with open(os.path.join(vaatplant_dir, 'vaatplant_all_snl.csv'), 'w') as f:
-    for file in os.listdir(vaatplant_dir):
-        if file.endswith('asc') and file.startswith('vaatplant') and os.path.isfile(os.path.join(vaatplant_dir, file))\
-                and 'SNL' in file:
-            print('{0} in progress'.format(file))
-            foo = pgo.ascii_species_grid_to_pd(vaatplant_dir, file)
-            print('\tDone with {0} rows at {1}'.format(foo.shape[0], datetime.datetime.now().strftime("%H:%M:%S")))
-            # holder.append(foo)
-            if i == 0:
-                f.write('# Deze tabel bevat alle informatie uit alle *SNL*.asc bestanden '
-                        'in d:\hotspot_working\b_vaatplanten\Soortenrijkdom\n')
-                f.write('# Deze bestanden zijn gebasseerd op de data levering van Kampichler 11 juni 2019\n')
-                f.write('# Hans Roelofsen, WEnR BB, 04 Jul 2019\n')
-                f.write(foo.to_csv(sep=';', header=True, index=False))
-            else:
-                f.write(foo.to_csv(sep=';', header=False, index=False))
-            i = + 1
+vogel_dir = r'd:\hotspot_working\a_broedvogels\Soortenrijkdom\Species_richness'
+snl_dir = r'd:\hotspot_working\a_broedvogels\SNL_grids'
+
+# output table per vaatplant soortlijst, see pgo.obs_sources
+vaatplant_tables = {'SNL': 'vaatplant_all_snl.csv', 'Bijl1': 'vaatplant_all_Bijl1.csv',
+                    'VHR': 'vaatplant_all_VHR.csv', 'EcoSysLijst': 'vaatplant_all_EcoSysLijst.csv'}
+
+
+def list_asc(dir_in, prefix=''):
+    # sorted list of ascii grids in *dir_in* starting with *prefix*
+    out = []
+    for file in sorted(os.listdir(dir_in)):
+        if file.endswith('asc') and file.startswith(prefix) and os.path.isfile(os.path.join(dir_in, file)):
+            out.append(file)
         else:
             print('{0} is not a valid input'.format(file))
+    return out
+
+
+def convert(dir_in, prefix, kind):
+    # convert grids in *dir_in* to its 'bin' subdirectory. Returns the bin directory, the manifest and the list of
+    # manifest entries that were converted or removed in this run
+    dir_bin = os.path.join(dir_in, 'bin')
+    asc_files = list_asc(dir_in, prefix)
+    if incremental:
+        manifest, converted, removed = asc_convert.update_dir(dir_in, asc_files, dir_bin, kind=kind,
+                                                              n_workers=n_workers)
+        return dir_bin, manifest, converted + removed
+    removed = asc_convert.remove_dropped(dir_bin, asc_files)
+    manifest = asc_convert.convert_dir(dir_in, asc_files, dir_bin, kind=kind, n_workers=n_workers)
+    return dir_bin, manifest, manifest + removed
+
+
+if __name__ == '__main__':
+
+    # Run for all ascii files in vaatplanten
+    vaatplant_bin, manifest, changed = convert(vaatplant_dir, 'vaatplant', 'species')
+    for soortlijst, table in vaatplant_tables.items():
+        if not any(entry['soortlijst'] == soortlijst for entry in changed):
             continue
+        asc_convert.grids_to_csv(vaatplant_bin, [entry for entry in manifest if entry['soortlijst'] == soortlijst],
+                                 os.path.join(vaatplant_dir, table),
+                                 header_lines=['Deze tabel bevat alle informatie uit alle *{0}*.asc bestanden in '
+                                               '{1}'.format(soortlijst, vaatplant_dir),
+                                               'Deze bestanden zijn gebasseerd op de data levering van Kampichler '
+                                               '11 juni 2019',
+                                               'Hans Roelofsen, WEnR BB, {0}'.format(pgo.get_timestring('full'))])
+        print('{0} written at {1}'.format(table, pgo.get_timestring('full')))
+    if obs_store.store_exists(pgo.obs_store_dir):
+        obs_store.update_from_grids(pgo.obs_store_dir, vaatplant_bin, manifest, changed, 'vaatplant')
 
-# df_all = pd.concat(holder)
-# df_all.to_csv(os.path.join(vaatplant_dir, 'vaatplant_all3.csv'), index=False, sep=';')
-# del df_all
+    # Run for all ascii files in broedvogels
+    vogel_bin, manifest, changed = convert(vogel_dir, 'vogel', 'species')
+    if changed:
+        asc_convert.grids_to_csv(vogel_bin, manifest, os.path.join(vogel_dir, 'vogel_all4.csv'))
+        print('vogel_all4.csv written at {0}'.format(pgo.get_timestring('full')))
+    if obs_store.store_exists(pgo.obs_store_dir):
+        obs_store.update_from_grids(pgo.obs_store_dir, vogel_bin, manifest, changed, 'vogel')
 
-# # Run for all ascii files in broedvogels
-vogel_dir = r'd:\hotspot_working\a_broedvogels\Soortenrijkdom\Species_richness'
-holder = []
-for file in os.listdir(vogel_dir):
-
-    if file.endswith('asc') and file.startswith('vogel') and os.path.isfile(os.path.join(vogel_dir, file)):
-        print('{0} in progress'.format(file))
-        foo = pgo.ascii_species_grid_to_pd(vogel_dir, file)
-        print('\tDone with {0} rows at {1}'.format(foo.shape[0], datetime.datetime.now().strftime("%H:%M:%S")))
-        holder.append(foo)
-    else:
-        print('{0} is not a valid input'.format(file))
-        continue
-
-df_all = pd.concat(holder)
-df_all.to_csv(os.path.join(vogel_dir, 'vogel_all4.csv'), index=False, sep=';')
-
-# Run for all SNL grids
-snl_dir = r'd:\hotspot_working\a_broedvogels\SNL_grids'
-for file in os.listdir(snl_dir):
-    if file.endswith('asc') and os.path.isfile(os.path.join(snl_dir, file)):
-        print('{0} in progress'.format(file))
-        foo = pgo.ascii_snl_grid_to_pd(snl_dir, file)
-        foo.to_pickle(os.path.join(snl_dir, 'augurken', os.path.splitext(file)[0] + '.pkl'))
-
-# 250m hok <-> provincie pandas dataframe to pkl
-prov = gp.read_file(r'd:\hotspot_working\shp_250mgrid\hok250m_prov2018.shp')
-prov.rename(columns={'ID': 'hok_id'}, inplace=True)
-prov.drop(['topleftx', 'toplefty', 'geometry'], axis=1).to_pickle(os.path.join(snl_dir, 'augurken', 'provincien2.pkl'))
\ No newline at end of file
+    # Run for all SNL grids, pickles of SNL grids no longer in snl_dir are removed
+    snl_bin, manifest, changed = convert(snl_dir, '', 'snl')
+    for entry in changed:
+        pkl = os.path.join(snl_dir, 'augurken', entry['snl'] + '.pkl')
+        if entry in manifest:
+            asc_convert.read_grid(snl_bin, entry).to_pickle(pkl)
+        elif os.path.isfile(pkl):
+            os.remove(pkl)
+            print('{0} removed, {1} is no longer in {2}'.format(pkl, entry['asc'], snl_dir))
+
+    # hok x SNL type area matrix, read by pgo.get_snl_hokids
+    if changed:
+        snl_matrix.build_snl_matrix(snl_bin)
+
+    # 250m hok <-> provincie pandas dataframe to pkl
+    prov = gp.read_file(r'd:\hotspot_working\shp_250mgrid\hok250m_prov2018.shp')
+    prov.rename(columns={'ID': 'hok_id'}, inplace=True)
+    prov['hok_id'] = pgo.as_hok_id(prov['hok_id'])
+    prov.drop(['topleftx', 'toplefty', 'geometry'], axis=1).to_pickle(os.path.join(snl_dir, 'augurken',
+                                                                                   'provincien2.pkl'))
@@ -0,0 +1,18 @@
+# Script to convert the observation tables (see pgo.obs_sources) to the columnar obs store read by pgo.query_all_obs.
+# Run once after prep_asc.py and prep_vlinder.py, and again after each new data delivery. Also writes the catalogue of
+# values per source used to skip sources when there is no obs store (see utils/obs_query.py).
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import shutil
+
+from utils import pgo
+from utils import obs_store
+from utils import obs_query
+
+# remove the existing store first, the conversion appends to existing partitions
+shutil.rmtree(pgo.obs_store_dir, ignore_errors=True)
+obs_store.build_obs_store(pgo.obs_sources, pgo.obs_store_dir)
+print('obs store written to {0} at {1}'.format(pgo.obs_store_dir, pgo.get_timestring('full')))
+
+obs_query.build_catalogue(pgo.obs_sources, pgo.obs_catalogue)
+print('obs catalogue written to {0} at {1}'.format(pgo.obs_catalogue, pgo.get_timestring('full')))
@@ -0,0 +1,17 @@
+# Script to build the 1km, 5km and 10km aggregation pyramid of the species counts per 250m hok, see utils/pyramid.py.
+# Built one soortgroep at a time, so that only the observations of one soortgroep are in memory. Run after
+# prep_obs_store.py, and again after each new data delivery.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+from utils import pgo
+from utils import pyramid
+
+soortgroepen = ['vogel', 'vlinder', 'vaatplant']
+
+for soortgroep in soortgroepen:
+    print('{0} to pyramid in progress at {1}'.format(soortgroep, pgo.get_timestring('full')))
+    obs = pgo.query_all_obs({'soortgroep': [soortgroep]})
+    pyramid.build_pyramid(obs)
+    del obs
+
+print('pyramid written to {0} at {1}'.format(pyramid.pyramid_dir, pgo.get_timestring('full')))
@@ -2,25 +2,50 @@
 # Hans Roelofsen, WEnR, 25*03*2019
 
 import os
-import numpy as np
+import sys
+import json
+import warnings
 import pandas as pd
-import rasterio as rio
 
-asc = rio.open(os.path.join(r'd:\hotspot_working\a_broedvogels\Soortenrijkdom\Species_richness',
-                            'vogel_OpenDuin_EcoSysLijst_2010-2017.asc'))
+from utils import pgo
+from utils import asc_convert
+from utils import grid
+from utils import obs_store
+
+# grid of the vogel data, the vlinder cells are identified on the same grid
+affine, shape = grid.from_asc(r'd:\hotspot_working\a_broedvogels\Soortenrijkdom\Species_richness',
+                              'vogel_OpenDuin_EcoSysLijst_2010-2017.asc')
 
 vlinder_dir = r'd:\hotspot_working\c_vlinders'
 vlinder_1ai = 'dagvl_sovon_snl_1ai.txt'  # SNL + Bijlage 1
 vlinder_1aii = 'dagvl_sovon_snl_1aii.txt'  # VHR soorten
 vlinder_2c = 'dagvl_sovon_2c.txt'  # Ecosysteemtype
+vlinder_out = 'vlinder_all_v2.txt'
+
+# Only rerun when one of the inputs is new or changed since the previous run, as recorded in the manifest
+incremental = True
+manifest_file = os.path.join(vlinder_dir, 'prep_vlinder_manifest.json')
+inputs = [vlinder_1ai, vlinder_1aii, vlinder_2c]
+try:
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+except OSError:
+    manifest = {}
+if incremental and os.path.isfile(os.path.join(vlinder_dir, vlinder_out)) and \
+        all(x in manifest and asc_convert.is_unchanged(os.path.join(vlinder_dir, x), manifest[x]) for x in inputs):
+    print('Vlinder inputs unchanged since {0}, nothing to do'.format(manifest_file))
+    sys.exit(0)
 
 
 # Note, vlinder x250, y250 = coordinates of cell-centre!
-# Transform to cell top-left for harmonisation with vogel and plant data, ie X: subtract 125m, Y: add 125m
+# The hok_id is that of the grid cell holding the centre, ie. the cell top-left as for the vogel and plant data
 def add_hok_id(df):
-    df['col'] = df.apply(lambda x: int(((x.x250, x.y250) * ~asc.affine)[0]), axis=1)
-    df['row'] = df.apply(lambda x: int(((x.x250, x.y250) * ~asc.affine)[1]), axis=1)
-    df['hok_id'] = df.apply(lambda x: str(np.subtract(x.x250, 125)) + '_' + str(np.add(x.y250, 125)), axis=1)
+    row, col = grid.xy_to_rowcol(affine, df['x250'].values, df['y250'].values)
+    if not grid.inside(row, col, shape).all():
+        warnings.warn('\t{0} vlinder cells are outside of the grid'.format((~grid.inside(row, col, shape)).sum()))
+    df['col'] = col
+    df['row'] = row
+    df['hok_id'] = grid.rowcol_to_hok_id(affine, row, col)
     return df
 
 # vlinder_1ai.txt: bevat SNL soortenlijst plus Bijlage 1 soorten per SNL beheerstype
@@ -59,5 +84,12 @@ vlinder_all = pd.concat([vl_1ai_snl, vl_1ai_bijl1, vl_1aii, vl_2c])
 vlinder_all.drop(labels='id', axis=1, inplace=True)
 vlinder_all.rename(columns={'x250': 'x_rd', 'y250': 'y_rd'}, inplace=True)
 vlinder_all['soortgroep'] = 'vlinder'
-vlinder_all.to_csv(os.path.join(vlinder_dir, 'vlinder_all_v2.txt'),
+vlinder_all.to_csv(os.path.join(vlinder_dir, vlinder_out),
                    index=False, sep=';')
+
+# update the vlinder partitions of the obs store, if there is one
+if obs_store.store_exists(pgo.obs_store_dir):
+    obs_store.replace_soortgroep(pgo.obs_store_dir, vlinder_all, 'vlinder', 'vlinder')
+
+with open(manifest_file, 'w') as f:
+    json.dump({x: asc_convert.file_signature(os.path.join(vlinder_dir, x)) for x in inputs}, f, indent=1)
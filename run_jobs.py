@@ -0,0 +1,25 @@
+# Script to run many scenarios of the analyse scripts in one go from a JSON job file, loading the observations once.
+# See utils/jobs.py for the layout of the job file. Usage: python run_jobs.py [job file]
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import sys
+
+from utils import jobs
+from utils import profiling
+
+job_file = r'd:\hotspot_working\jobs\kwartaal.json'
+
+# number of worker processes for the snl types, 1 runs all snl types one after the other in this process
+n_workers = 1
+
+# timing and memory per stage, snl type and scenario (see utils/profiling.py) as JSON or CSV report, None for no report
+profile_report = None  # eg. r'd:\hotspot_working\jobs\stages.json'
+profiling.profile_dir = None  # directory for a cProfile dump of the slowest stage, None for no dump
+
+if __name__ == '__main__':
+    job_file = sys.argv[1] if len(sys.argv) > 1 else job_file
+    jobs.run_jobs(job_file, n_workers=n_workers)
+
+    if profile_report:
+        profiling.write_report(profile_report, info={'script': 'run_jobs', 'job_file': job_file,
+                                                     'n_workers': n_workers})
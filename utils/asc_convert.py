@@ -0,0 +1,174 @@
+# Conversion of ascii grids (species counts per 250m hok, or SNL area per hok) to compact binary per-grid files, see
+# prepare_data/prep_asc.py. Each grid is read in windows of rows and stored as .npz holding the sparse flat cell index
+# (row * ncols + col) and the value of all cells that are neither zero nor NoData. A manifest.json in the output
+# directory lists all grids with their specs, affine, attributes inferred from the file name and the size, mtime and
+# content hash of the source grid, so that update_dir only reconverts new or changed grids.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import hashlib
+import json
+import os
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import rasterio as rio
+from rasterio.transform import Affine
+from rasterio.windows import Window
+
+from utils import grid
+from utils import timestamps
+
+manifest_name = 'manifest.json'
+
+
+def file_signature(path):
+    # returns dictionary with size, mtime and sha1 content hash of file *path*
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            sha1.update(block)
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': sha1.hexdigest()}
+
+
+def is_unchanged(path, signature):
+    # True if file *path* has the same contents as when *signature* was taken. Size and mtime are checked first, the
+    # content hash only when the mtime differs (eg. after copying a redelivery with unchanged contents)
+    stat = os.stat(path)
+    if stat.st_size != signature.get('size'):
+        return False
+    if stat.st_mtime == signature.get('mtime'):
+        return True
+    return file_signature(path)['sha1'] == signature.get('sha1')
+
+
+def convert_asc(args):
+    # convert single ascii grid to npz, args = (dir_in, asc_in, dir_out, kind, block_rows). kind is 'species' for
+    # species counts (stored as int16) or 'snl' for SNL area in m2 (stored as int32). Returns manifest entry
+    dir_in, asc_in, dir_out, kind, block_rows = args
+    specs = grid.read_specs(dir_in, asc_in)
+    dtype = np.int16 if kind == 'species' else np.int32
+
+    cell_holder, val_holder = [], []
+    with rio.open(os.path.join(dir_in, asc_in)) as asc:
+        nrows, ncols = asc.shape
+        affine = tuple(asc.transform)[:6]
+        for row0 in range(0, nrows, block_rows):
+            block = asc.read(1, window=Window(0, row0, ncols, min(block_rows, nrows - row0))).astype(dtype)
+            row, col, vals = grid.nonempty_cells(block, specs['NODATA_value'])
+            cell_holder.append(((row + row0) * ncols + col).astype(np.int32))
+            val_holder.append(vals)
+
+    out_name = os.path.splitext(asc_in)[0] + '.npz'
+    cells, vals = np.concatenate(cell_holder), np.concatenate(val_holder)
+    np.savez(os.path.join(dir_out, out_name), cell=cells, val=vals)
+
+    entry = {'asc': asc_in, 'npz': out_name, 'kind': kind, 'n_cells': int(cells.size), 'nrows': nrows,
+             'ncols': ncols, 'affine': affine, 'specs': {k: int(v) for k, v in specs.items()},
+             'source': file_signature(os.path.join(dir_in, asc_in))}
+    if kind == 'species':
+        groep, snl, soortlijst, periode = os.path.splitext(asc_in)[0].split('_')
+        entry.update({'soortgroep': groep, 'snl': snl, 'soortlijst': soortlijst, 'periode': periode})
+    else:
+        entry['snl'] = os.path.splitext(asc_in)[0]
+    print('\t{0} done with {1} cells at {2}'.format(asc_in, cells.size, timestamps.get_timestring('full')))
+    return entry
+
+
+def convert_dir(dir_in, asc_files, dir_out, kind, n_workers=1, block_rows=256):
+    # convert list of *asc_files* in *dir_in* to npz files in *dir_out* using *n_workers* processes, and write the
+    # manifest. Returns the manifest, ie. list of entries in the order of asc_files
+    os.makedirs(dir_out, exist_ok=True)
+    tasks = [(dir_in, asc_in, dir_out, kind, block_rows) for asc_in in asc_files]
+    if n_workers == 1:
+        manifest = [convert_asc(task) for task in tasks]
+    else:
+        with mp.Pool(processes=n_workers) as pool:
+            manifest = pool.map(convert_asc, tasks, chunksize=1)
+    write_manifest(dir_out, manifest)
+    return manifest
+
+
+def update_dir(dir_in, asc_files, dir_out, kind, n_workers=1, block_rows=256):
+    # incremental version of convert_dir: only grids that are new, or changed since the manifest in *dir_out* was
+    # written, are converted. Entries and npz files of grids no longer in *asc_files* are removed.
+    # Returns (manifest, list of converted entries, list of removed entries)
+    os.makedirs(dir_out, exist_ok=True)
+    try:
+        previous = {entry['asc']: entry for entry in read_manifest(dir_out)}
+    except OSError:
+        previous = {}
+
+    todo = [asc_in for asc_in in asc_files if asc_in not in previous or 'source' not in previous[asc_in]
+            or not is_unchanged(os.path.join(dir_in, asc_in), previous[asc_in]['source'])]
+    print('{0} of {1} grids in {2} are new or changed'.format(len(todo), len(asc_files), dir_in))
+    tasks = [(dir_in, asc_in, dir_out, kind, block_rows) for asc_in in todo]
+    if n_workers == 1 or len(tasks) <= 1:
+        converted = [convert_asc(task) for task in tasks]
+    else:
+        with mp.Pool(processes=min(n_workers, len(tasks))) as pool:
+            converted = pool.map(convert_asc, tasks, chunksize=1)
+
+    removed = remove_dropped(dir_out, asc_files)
+
+    for asc_in in [asc_in for asc_in in asc_files if asc_in not in todo]:
+        # contents unchanged, but refresh the mtime so that the content hash is not needed next time
+        if os.stat(os.path.join(dir_in, asc_in)).st_mtime != previous[asc_in]['source']['mtime']:
+            previous[asc_in]['source'] = file_signature(os.path.join(dir_in, asc_in))
+
+    by_asc = dict(previous)
+    by_asc.update({entry['asc']: entry for entry in converted})
+    manifest = [by_asc[asc_in] for asc_in in asc_files]
+    write_manifest(dir_out, manifest)
+    return manifest, converted, removed
+
+
+def remove_dropped(dir_out, asc_files):
+    # remove the npz files of the grids in the manifest in *dir_out* that are not in *asc_files*. Returns list of their
+    # manifest entries
+    try:
+        previous = read_manifest(dir_out)
+    except OSError:
+        return []
+    removed = [entry for entry in previous if entry['asc'] not in asc_files]
+    for entry in removed:
+        if os.path.isfile(os.path.join(dir_out, entry['npz'])):
+            os.remove(os.path.join(dir_out, entry['npz']))
+    return removed
+
+
+def write_manifest(dir_out, manifest):
+    with open(os.path.join(dir_out, manifest_name), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def read_manifest(dir_out):
+    with open(os.path.join(dir_out, manifest_name), 'r') as f:
+        return json.load(f)
+
+
+def read_grid(dir_out, entry):
+    # returns pandas dataframe from npz grid described by manifest *entry*, with the same columns as
+    # pgo.ascii_species_grid_to_pd (kind 'species') or pgo.ascii_snl_grid_to_pd (kind 'snl')
+    with np.load(os.path.join(dir_out, entry['npz'])) as npz:
+        cells, vals = npz['cell'], npz['val']
+    row, col = np.divmod(cells, entry['ncols'])
+    affine = Affine(*entry['affine'])
+    x_rd, y_rd = grid.rowcol_to_topleft(affine, row, col)
+    hok_id = grid.rowcol_to_hok_id(affine, row, col)
+
+    if entry['kind'] == 'snl':
+        return pd.DataFrame({'area_m2': vals, 'hok_id': hok_id}, index=cells)
+    return pd.DataFrame({'n': vals, 'soortgroep': entry['soortgroep'], 'snl': entry['snl'],
+                         'periode': entry['periode'], 'soortlijst': entry['soortlijst'], 'row': row, 'col': col,
+                         'x_rd': x_rd.astype(np.int32), 'y_rd': y_rd.astype(np.int32), 'hok_id': hok_id}, index=cells)
+
+
+def grids_to_csv(dir_out, entries, csv_out, header_lines=()):
+    # write the species grids in manifest *entries* to one semicolon separated table *csv_out*, grid by grid, with
+    # *header_lines* as # comment lines on top
+    with open(csv_out, 'w') as f:
+        for line in header_lines:
+            f.write('# {0}\n'.format(line))
+        for i, entry in enumerate(entries):
+            read_grid(dir_out, entry).to_csv(f, sep=';', header=i == 0, index=False)
@@ -0,0 +1,96 @@
+# Dense NumPy cube of PGO species counts, as replacement of pd.pivot_table on long-format observations. Species counts
+# *n* are scattered into an int16 array indexed by (cell, periode, soortgroep, soortlijst, snl), after which pivots,
+# Annex 1 (Bijl1) capping, sums and means are array reductions.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import numpy as np
+import pandas as pd
+
+dims = ['periode', 'soortgroep', 'soortlijst', 'snl']
+
+
+def cap_values(vals, cap):
+    # cap array or dataframe *vals* to a maximum of *cap*, NaN stays NaN
+    return np.minimum(vals, cap)
+
+
+class ObsCube:
+    # Dense cube of species counts of long-format observations dataframe *obs* with columns hok_id, n and dims.
+    # counts holds the summed n per (cell, periode, soortgroep, soortlijst, snl), present is True where at least one
+    # observation went into the sum, so that 'no observation' (NaN in a pivot table) can be told apart from n = 0.
+
+    def __init__(self, obs):
+        cell_codes, cells = pd.factorize(obs['hok_id'], sort=True)
+        self.cells = pd.Index(np.asarray(cells), name='hok_id')
+        self.labels = {}
+        codes = [cell_codes]
+        for dim in dims:
+            dim_codes, uniques = pd.factorize(obs[dim], sort=True)
+            self.labels[dim] = [str(x) for x in uniques]
+            codes.append(dim_codes)
+
+        shape = (len(self.cells),) + tuple(len(self.labels[dim]) for dim in dims)
+        flat_u, inverse = np.unique(np.ravel_multi_index(codes, shape), return_inverse=True)
+        sums = np.bincount(inverse.ravel(), weights=obs['n'].values, minlength=len(flat_u))
+        if sums.size and (sums.max() > np.iinfo(np.int16).max or sums.min() < np.iinfo(np.int16).min):
+            raise Exception('Sorry, summed species counts do not fit in the int16 cube.')
+
+        self.counts = np.zeros(shape, dtype=np.int16)
+        self.present = np.zeros(shape, dtype=bool)
+        self.counts.flat[flat_u] = sums
+        self.present.flat[flat_u] = True
+
+    def _select(self, **sel):
+        # return counts, present and the dim labels, restricted to the dim labels in *sel*, eg. periode='2010-2017'
+        # or soortlijst=['SNL', 'Bijl1']
+        counts, present, labels = self.counts, self.present, dict(self.labels)
+        for dim, sel_labels in sel.items():
+            if sel_labels is None:
+                continue
+            sel_labels = sel_labels if isinstance(sel_labels, list) else [sel_labels]
+            try:
+                idx = [self.labels[dim].index(label) for label in sel_labels]
+            except ValueError:
+                raise KeyError('{0} not in {1} of the cube'.format(sel_labels, dim))
+            axis = dims.index(dim) + 1
+            counts, present = np.take(counts, idx, axis=axis), np.take(present, idx, axis=axis)
+            labels[dim] = sel_labels
+        return counts, present, labels
+
+    def pivot(self, columns, dropna=True, **sel):
+        # returns pivot table of the summed counts with hok_id as index and (Multi)Index *columns*, like
+        # pd.pivot_table(data=obs, index='hok_id', columns=columns, values='n', aggfunc='sum', dropna=dropna).
+        # Optionally restricted to the dim labels in *sel* first
+        counts, present, labels = self._select(**sel)
+        col_axes = [dims.index(dim) + 1 for dim in columns]
+        other_axes = tuple(dims.index(dim) + 1 for dim in dims if dim not in columns)
+        remaining = [0] + sorted(col_axes)
+        perm = [remaining.index(axis) for axis in [0] + col_axes]
+
+        sums = counts.sum(axis=other_axes, dtype=np.int64).transpose(perm).reshape(len(self.cells), -1)
+        observed = present.any(axis=other_axes).transpose(perm).reshape(len(self.cells), -1)
+
+        if len(columns) > 1:
+            col_index = pd.MultiIndex.from_product([labels[dim] for dim in columns], names=columns)
+        else:
+            col_index = pd.Index(labels[columns[0]], name=columns[0])
+
+        if observed.all():
+            return pd.DataFrame(sums, index=self.cells, columns=col_index)
+        out = pd.DataFrame(np.where(observed, sums, np.nan), index=self.cells, columns=col_index)
+        if dropna:
+            out = out.loc[observed.any(axis=1), observed.any(axis=0)]
+        return out
+
+    def total(self, cap=None, **sel):
+        # returns Series with the summed counts per hok_id over all cube entries in *sel*, zero where there are no
+        # observations. Optionally capped to *cap*, eg. total(periode=p, soortlijst='Bijl1', cap=2) for Bijl1 capping
+        counts, _, _ = self._select(**sel)
+        out = counts.reshape(len(self.cells), -1).sum(axis=1, dtype=np.int64)
+        if cap is not None:
+            out = cap_values(out, cap)
+        return pd.Series(out, index=self.cells)
+
+    def mean(self, divisor, cap=None, **sel):
+        # returns Series with total(...) per hok_id divided by Series *divisor*, eg. the number of snl types per hok_id
+        return np.divide(self.total(cap=cap, **sel), divisor.reindex(self.cells))
@@ -0,0 +1,158 @@
+# The 250m grid of the PGO data in one place: conversion between RD New coordinates, cell top-left, cell centre,
+# row/col and the integer hok_id, for whole arrays at once. A grid is given by an affine and a shape (nrows, ncols),
+# read from the header of an ascii grid (from_asc), or the national 250m grid below. Sources get their hok_id from the
+# row/col of their coordinates on the grid (xy_to_hok_id), whether they give the cell top-left (vogel and vaatplant
+# grids), the cell centre (vlinder tables) or any other point in the cell, so that they agree on cell identity.
+# The hok_id is the cell top-left packed into one int64 as x_rd * 1e6 + y_rd, unique because 0 <= y_rd < 1e6 in RD New.
+# Its string form "{x_rd}_{y_rd}" is for export and for reading tables written before the integer hok_id.
+# Grids are north-up: the affine has no rotation, row 0 is the top row.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import os
+import numpy as np
+import pandas as pd
+from rasterio.transform import Affine
+
+cellsize = 250
+national_affine, national_shape = Affine(250, 0, 0, 0, -250, 650000), (1400, 1200)  # all 250m hokken
+national_extent = [0, 300000, 300000, 650000]  # xmin, xmax, ymin, ymax of the national grid
+
+
+def read_specs(dir_in, asc_in):
+    # returns dictionary with the header of ascii grid *asc_in*, eg. NCOLS, NROWS, XLLCORNER, YLLCORNER, CELLSIZE and
+    # NODATA_value, as integers. Only the header lines are read
+    specs = {}
+    with open(os.path.join(dir_in, asc_in), 'r') as f:
+        for line in f:
+            parts = line.split()
+            if not parts or not parts[0][0].isalpha():
+                break
+            specs[parts[0]] = np.int32(np.float32(parts[1]))
+    return specs
+
+
+def from_specs(specs):
+    # returns affine and shape (nrows, ncols) of the grid with ascii grid header *specs*
+    size = specs['CELLSIZE']
+    xll = specs['XLLCORNER'] if 'XLLCORNER' in specs else specs['XLLCENTER'] - size / 2
+    yll = specs['YLLCORNER'] if 'YLLCORNER' in specs else specs['YLLCENTER'] - size / 2
+    return Affine(size, 0, xll, 0, -size, yll + specs['NROWS'] * size), (int(specs['NROWS']), int(specs['NCOLS']))
+
+
+def from_asc(dir_in, asc_in):
+    # returns affine and shape (nrows, ncols) of the grid of ascii grid *asc_in*
+    return from_specs(read_specs(dir_in, asc_in))
+
+
+def extent(affine, shape):
+    # returns [xmin, xmax, ymin, ymax] of the grid
+    return [affine.c, affine.c + shape[1] * affine.a, affine.f + shape[0] * affine.e, affine.f]
+
+
+def encode(x_rd, y_rd):
+    # returns array of integer hok_ids for arrays of cell top-left x_rd, y_rd
+    return np.asarray(x_rd, dtype=np.int64) * 1000000 + np.asarray(y_rd, dtype=np.int64)
+
+
+def decode(hok_id):
+    # returns arrays x_rd, y_rd of the cell top-left for array of integer hok_ids
+    return np.divmod(np.asarray(hok_id, dtype=np.int64), 1000000)
+
+
+def to_str(hok_id):
+    # returns series with the string form "{x_rd}_{y_rd}" of integer hok_ids, for export only
+    x_rd, y_rd = decode(hok_id)
+    index = hok_id.index if isinstance(hok_id, pd.Series) else None
+    return pd.Series(x_rd, index=index).astype(str) + '_' + pd.Series(y_rd, index=index).astype(str)
+
+
+def from_str(hok_id):
+    # returns series of integer hok_ids for series of string hok_ids "{x_rd}_{y_rd}"
+    xy = pd.Series(hok_id).str.split('_', expand=True).astype(np.int64)
+    return pd.Series(encode(xy[0], xy[1]), index=xy.index)
+
+
+def as_hok_id(hok_id):
+    # returns series of integer hok_ids, converting from the string form if needed
+    if pd.api.types.is_integer_dtype(hok_id):
+        return hok_id
+    return from_str(hok_id)
+
+
+def centre_to_topleft(x, y, size=cellsize):
+    # returns arrays x, y of the top-left of cells with centre *x*, *y*
+    return np.asarray(x) - size / 2, np.asarray(y) + size / 2
+
+
+def topleft_to_centre(x, y, size=cellsize):
+    # returns arrays x, y of the centre of cells with top-left *x*, *y*
+    return np.asarray(x) + size / 2, np.asarray(y) - size / 2
+
+
+def rowcol_to_topleft(affine, row, col):
+    # returns float arrays x, y of the top-left of the cells at *row*, *col*
+    a, b, c, d, e, f = tuple(affine)[:6]
+    row = np.asarray(row, dtype=np.float64)
+    col = np.asarray(col, dtype=np.float64)
+    return a * col + b * row + c, d * col + e * row + f
+
+
+def rowcol_to_centre(affine, row, col):
+    # returns float arrays x, y of the centre of the cells at *row*, *col*
+    return rowcol_to_topleft(affine, np.asarray(row) + 0.5, np.asarray(col) + 0.5)
+
+
+def xy_to_rowcol(affine, x, y):
+    # returns int64 arrays row, col of the cells holding points *x*, *y*. Points on a cell edge belong to the cell
+    # right of and below the edge, so a cell top-left gives that cell
+    if affine.b != 0 or affine.d != 0:
+        raise Exception('Sorry, rotated grids are not supported.')
+    col = np.floor((np.asarray(x, dtype=np.float64) - affine.c) / affine.a).astype(np.int64)
+    row = np.floor((np.asarray(y, dtype=np.float64) - affine.f) / affine.e).astype(np.int64)
+    return row, col
+
+
+def inside(row, col, shape):
+    # returns boolean array of the *row*, *col* within a grid of *shape*
+    return (row >= 0) & (row < shape[0]) & (col >= 0) & (col < shape[1])
+
+
+def rowcol_to_hok_id(affine, row, col):
+    # returns array of integer hok_ids of the cells at *row*, *col*
+    x, y = rowcol_to_topleft(affine, row, col)
+    return encode(np.rint(x), np.rint(y))
+
+
+def xy_to_hok_id(affine, x, y):
+    # returns array of integer hok_ids of the cells holding points *x*, *y*
+    row, col = xy_to_rowcol(affine, x, y)
+    return rowcol_to_hok_id(affine, row, col)
+
+
+def hok_id_to_rowcol(hok_id, affine, shape):
+    # returns arrays row, col of integer hok_ids on the grid, and boolean mask of the hok_ids inside the grid
+    row, col = xy_to_rowcol(affine, *decode(hok_id))
+    return row, col, inside(row, col, shape)
+
+
+def hok_id_to_centre(hok_id, size=cellsize):
+    # returns arrays x, y of the centre of the cells of integer hok_ids of cells of *size*
+    return topleft_to_centre(*decode(hok_id), size=size)
+
+
+def nonempty_cells(vals, nodata):
+    # returns arrays row, col and values of the cells in 2D array *vals* that are neither zero nor *nodata*, in
+    # row-major order
+    row, col = np.nonzero((vals != nodata) & (vals != 0))
+    return row, col, vals[row, col]
+
+
+def all_cells(shape):
+    # returns arrays row, col of all cells of a grid of *shape*, in row-major order
+    return np.indices(shape).reshape(2, -1)
+
+
+def coarse_hok_id(hok_id, size, fine_size=cellsize):
+    # returns array of integer hok_ids of the cells of *size* holding the cells *hok_id* of *fine_size*, with the
+    # coarse cells aligned to RD New 0, 0
+    return xy_to_hok_id(Affine(size, 0, 0, 0, -size, 0), *hok_id_to_centre(hok_id, fine_size))
@@ -0,0 +1,136 @@
+# Grouped computation of the extended table (analyse_for_extended_tab.py) for all snl types in one pass, instead of a
+# query, pivot, Bijl1 capping, merge and rename per snl type followed by pd.concat. The observations of all snl types
+# are grouped by (snl type, cell) and (periode, soortgroep, soortlijst) once with a single bincount, the SNL area per
+# (snl type, cell) comes from one product with the sparse SNL matrix (see utils/snl_matrix.py).
+# A group is a list of snl labels in the observations, eg. {'N1705': ['N1705']} or, for an ecosysteemtype compiled
+# from beheertypen, {'Bos': pgo.ecosys_2_beheer('Bos')}. The same labels select the SNL area of the group. A label may
+# be in more than one group, its observations then count in each of them.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import warnings
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils import provincie
+from utils import snl_matrix
+
+col_short = {'2010-2017': '1017', '1994-2001': '9401', '2002-2009': '0209', 'vogel': 'Vo', 'vlinder': 'Vl',
+             'vaatplant': 'Pl', 'SNL': 'SNL', 'Bijl1': 'B1', 'cap': 'c', 'tot': 't'}
+
+
+def short_colnames(columns):
+    # returns list of column names with the parts of tuple names shortened with col_short and joined, eg.
+    # ('2010-2017', 'vogel', 'Bijl1') to '1017VoB1'. Other names are kept
+    return [''.join(col_short.get(x, x) for x in col) if isinstance(col, tuple) else col for col in columns]
+
+
+def expand_groups(snl, groups):
+    # returns arrays (row, group) pairing the positions in categorical series *snl* with the index of each group in
+    # list *groups* (lists of snl labels) that holds the label of the row
+    cats = list(snl.cat.categories)
+    pairs = sorted((cats.index(label), g) for g, labels in enumerate(groups) for label in set(labels) if label in cats)
+    pair_cat = np.array([cat for cat, _ in pairs], dtype=np.int64)
+    pair_group = np.array([g for _, g in pairs], dtype=np.int64)
+
+    codes = snl.cat.codes.values.astype(np.int64)
+    n_per_cat = np.bincount(pair_cat, minlength=len(cats) + 1)[:len(cats)]
+    first = np.searchsorted(pair_cat, np.arange(len(cats)))
+    k = np.where(codes >= 0, n_per_cat[codes], 0)
+    row = np.repeat(np.arange(codes.size), k)
+    offset = np.arange(row.size) - np.repeat(np.cumsum(k) - k, k)  # position of each copy among the copies of its row
+    return row, pair_group[first[codes[row]] + offset]
+
+
+def snl_areas(groups, hok_id, group, treshold=0, path=None):
+    # returns arrays snl_count and snl_area_m2 per (hok_id, group) pair, as pgo.get_snl_hokids(groups[group], treshold)
+    # would give for that hok. snl_count is 0 where the hok has none of the snl types of the group
+    labels = list(dict.fromkeys(label for labels in groups for label in labels))
+    sel, matrix_hok_id = snl_matrix.select(labels, treshold, path)
+    rollup = np.zeros((len(labels), len(groups)), dtype=np.int64)
+    for g, group_labels in enumerate(groups):
+        rollup[[labels.index(label) for label in group_labels], g] = 1
+    rollup = sparse.csr_matrix(rollup)
+    area = (sel.astype(np.int64) @ rollup).tocsr()
+    count = ((sel != 0).astype(np.int64) @ rollup).tocsr()
+
+    pos = np.minimum(np.searchsorted(matrix_hok_id, hok_id), max(matrix_hok_id.size - 1, 0))
+    found = matrix_hok_id[pos] == hok_id if matrix_hok_id.size else np.zeros(hok_id.size, dtype=bool)
+    snl_count = np.zeros(hok_id.size, dtype=np.int64)
+    snl_area = np.zeros(hok_id.size, dtype=np.int64)
+    snl_count[found] = np.asarray(count[pos[found], group[found]]).ravel()
+    snl_area[found] = np.asarray(area[pos[found], group[found]]).ravel()
+    return snl_count, snl_area
+
+
+def extended_table(obs, groups, treshold=0, path=None):
+    # returns the combined extended table of observations dataframe *obs* (hok_id, n, snl, periode, soortgroep,
+    # soortlijst) for *groups*, a dictionary {snl type: [snl labels]}. One row per snl type and hok having both
+    # observations and SNL area of the type, with species counts per periode, soortgroep and soortlijst (missing
+    # where 0), the Bijl1 total and Bijl1 capped to 2 per periode, hok_id, snl_count, snl_area_m2, provincie and
+    # snl_type, with columns named as in analyse_for_extended_tab.py. *path* is the SNL matrix, see utils/snl_matrix.py
+    names = list(groups)
+    group_labels = [list(groups[name]) for name in names]
+    snl = obs['snl'] if isinstance(obs['snl'].dtype, pd.CategoricalDtype) else obs['snl'].astype('category')
+    row, group = expand_groups(snl, group_labels)
+
+    # codes of the pivot dimensions, labels sorted as in cube.ObsCube
+    dim_codes, dim_labels = [], []
+    for dim in ['periode', 'soortgroep', 'soortlijst']:
+        codes, uniques = pd.factorize(obs[dim].values[row], sort=True)
+        dim_codes.append(codes)
+        dim_labels.append([str(x) for x in uniques])
+    n_p, n_g, n_l = (len(labels) for labels in dim_labels)
+    n_cols = n_p * n_g * n_l
+
+    # one output row per (group, cell), ordered by group and then hok_id
+    cell_codes, cells = pd.factorize(obs['hok_id'].values[row], sort=True)
+    cells = np.asarray(cells)
+    row_keys, row_inverse = np.unique(group * max(cells.size, 1) + cell_codes, return_inverse=True)
+    row_group, row_hok_id = row_keys // max(cells.size, 1), cells[row_keys % max(cells.size, 1)]
+    col_key = np.ravel_multi_index(dim_codes, (n_p, n_g, n_l))
+    flat = row_inverse.ravel() * n_cols + col_key
+    sums = np.bincount(flat, weights=obs['n'].values[row], minlength=row_keys.size * n_cols)
+    present = np.bincount(flat, minlength=row_keys.size * n_cols) > 0
+    sums = sums.reshape(row_keys.size, n_p, n_g, n_l)
+    present = present.reshape(row_keys.size, n_p, n_g, n_l)
+
+    # labels present per group, as the labels of a per snl type pivot
+    has = []
+    for i, codes in enumerate(dim_codes):
+        has_dim = np.zeros((len(names), len(dim_labels[i])), dtype=bool)
+        has_dim[group, codes] = True
+        has.append(has_dim)
+    has_col = has[0][:, :, None, None] & has[1][:, None, :, None] & has[2][:, None, None, :]
+
+    out = {}
+    for p, g, l in zip(*np.nonzero(has_col.any(axis=0))):
+        vals = sums[:, p, g, l]
+        out[(dim_labels[0][p], dim_labels[1][g], dim_labels[2][l])] = np.where(present[:, p, g, l] & (vals != 0),
+                                                                               vals, np.nan)
+    if 'Bijl1' in dim_labels[2]:
+        bijl1 = dim_labels[2].index('Bijl1')
+        bijl1_tot = sums[:, :, :, bijl1].sum(axis=2)
+        for p, periode in enumerate(dim_labels[0]):
+            has_b1 = has[0][:, p] & has[2][:, bijl1]
+            if has_b1.any():
+                out[(periode, 'B1tot', '')] = np.where(has_b1[row_group], bijl1_tot[:, p], np.nan)
+                out[(periode, 'B1cap', '')] = np.where(has_b1[row_group], np.minimum(bijl1_tot[:, p], 2), np.nan)
+    table = pd.DataFrame(out)
+    del sums, present
+
+    # inner join to the hokken with SNL area of the type
+    snl_count, snl_area = snl_areas(group_labels, row_hok_id, row_group, treshold, path)
+    has_area = snl_count > 0
+    if not has_area.all():
+        warnings.warn('\tBeware, there are {0} cells(s) with observations, but not marked as belonging to their SNL '
+                      'type!'.format((~has_area).sum()))
+    table = table[has_area].reset_index(drop=True)
+    table['hok_id'] = row_hok_id[has_area]
+    table['snl_count'] = snl_count[has_area]
+    table['snl_area_m2'] = snl_area[has_area]
+    table['provincie'] = provincie.dominant_provincie(table['hok_id'].values)
+    table['snl_type'] = np.array(names, dtype=object)[row_group[has_area]]
+    table.columns = short_colnames(table.columns)
+    print('\t{0} rows for {1} snl types'.format(table.shape[0], len(names)))
+    return table
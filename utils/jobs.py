@@ -0,0 +1,180 @@
+# Batch runs of the per-snl-type analyse scripts for many scenarios from one declarative job file. A scenario is a set
+# of values for the module globals of an analyse script (soort, snl_types, soort_lijst, periodes, out_dir, print_*
+# flags, ...); globals not given keep the value in the script. The runner
+#  - loads the observations needed by all scenarios together once, into one ObsSession,
+#  - runs per snl type all scenarios holding that snl type one after the other, so that scenarios asking for the same
+#    selection share one query and one ObsCube (see ObsSession max_results),
+#  - writes the combined tables of scenarios that have them (write_all_tables of the script).
+#
+# Job file (JSON):
+# {"out_dir": "d:\\hotspot_working\\z_out\\kwartaal",             base directory, each scenario writes to <name>/
+#  "defaults": {"periodes": ["2002-2009", "2010-2017"]},             globals for all scenarios having them
+#  "scenarios": [
+#     {"name": "maps", "script": "maps_tabs", "snl_types": ["N1705", "N1402"], "print_tif": true},
+#     {"name": "ext", "script": "extended_tab", "snl_types": ["N1705"],
+#      "vary": {"soort": ["vogel", "vlinder"], "soort_lijst": [["SNL"], ["SNL", "Bijl1"]]}}]}
+# "vary" expands a scenario to one scenario per combination of the listed values, named <name>_<value>_<value>.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import importlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import types
+import warnings
+
+from utils import obs_query
+from utils import obs_session
+from utils import parallel
+from utils import pgo
+from utils import profiling
+
+scripts = {'maps_tabs': 'analyse_for_maps_tabs', 'extended_tab': 'analyse_for_extended_tab'}
+derived = {'labels': 'periodes'}  # script globals that follow another global unless given themselves
+
+_defaults = {}  # script: {global: value as in the script}
+_scenarios = []  # scenarios of the running job, see run_jobs
+
+
+def script_defaults(script):
+    # returns dictionary of the configurable module globals of *script* with their values as in the script file
+    if script not in scripts:
+        raise Exception('Sorry, script {0} is not known, choose from {1}.'.format(script, ', '.join(scripts)))
+    if script not in _defaults:
+        # importing runs the settings at the top of the script, keep the profiling set up by the caller
+        profile_dir = profiling.profile_dir
+        module = importlib.import_module(scripts[script])
+        profiling.profile_dir = profile_dir
+        _defaults[script] = {key: value for key, value in vars(module).items() if not key.startswith('_') and not
+                             isinstance(value, (types.ModuleType, types.FunctionType, type))}
+    return _defaults[script]
+
+
+def expand(scenario):
+    # returns list of scenarios, one per combination of the values in scenario['vary'], or [scenario] without 'vary'
+    vary = scenario.get('vary')
+    if not vary:
+        return [scenario]
+    out = []
+    for combination in itertools.product(*vary.values()):
+        name = '_'.join([scenario['name']] + [''.join(v) if isinstance(v, list) else str(v) for v in combination])
+        out.append(dict({k: v for k, v in scenario.items() if k != 'vary'}, name=name, **dict(zip(vary, combination))))
+    return out
+
+
+def read_jobs(path):
+    # returns list of scenarios from job file *path*, each a dictionary with name, script and settings, the full set
+    # of module globals for the script
+    with open(path) as f:
+        job = json.load(f)
+    scenarios = []
+    for i, scenario in enumerate(job['scenarios']):
+        scenario = dict(scenario)
+        scenario.setdefault('name', 'scenario{0:02d}'.format(i + 1))
+        scenarios.extend(expand(scenario))
+
+    out = []
+    for scenario in scenarios:
+        defaults = script_defaults(scenario.get('script'))
+        given = {k: v for k, v in scenario.items() if k not in ['name', 'script']}
+        unknown = set(given) - set(defaults)
+        if unknown:
+            raise Exception('Sorry, {0} are not settings of {1} (scenario {2}).'.format(
+                ', '.join(sorted(unknown)), scenario['script'], scenario['name']))
+        # job defaults apply to the scripts that have the setting
+        given = dict({k: v for k, v in job.get('defaults', {}).items() if k in defaults}, **given)
+        settings = dict(defaults, **given)
+        for key, source in derived.items():
+            if key in defaults and key not in given:
+                settings[key] = settings[source]
+        if 'out_dir' not in given and 'out_dir' in job:
+            settings['out_dir'] = os.path.join(job['out_dir'], scenario['name'])
+        out.append({'name': scenario['name'], 'script': scenario['script'], 'settings': settings})
+        check_settings(out[-1])
+
+    names = [scenario['name'] for scenario in out]
+    if len(set(names)) < len(names):
+        raise Exception('Sorry, scenario names in {0} are not unique.'.format(path))
+    return out
+
+
+def check_settings(scenario):
+    # raise an Exception for *scenario* settings that the script would refuse at import
+    settings = scenario['settings']
+    if settings.get('report_stat') == 'mean' and settings.get('calculate_means') is False:
+        raise Exception('Sorry, set calculate_means to True when requesting means for reporting (scenario {0}).'
+                        .format(scenario['name']))
+
+
+def data_filter(scenarios):
+    # returns obs_query.ObsFilter with the union of the periodes, soortgroepen and soortlijsten of *scenarios*
+    values = {'periode': set(), 'soortgroep': set(), 'soortlijst': set()}
+    for scenario in scenarios:
+        settings = scenario['settings']
+        values['periode'].update(settings['periodes'])
+        values['soortgroep'].update(pgo.parse_soort_sel(settings['soort']))
+        values['soortlijst'].update(settings['soort_lijst'])
+    return obs_query.ObsFilter(**{col: sorted(vals) for col, vals in values.items()})
+
+
+def apply(scenario):
+    # set the module globals of the script of *scenario* to its settings and return the module
+    check_settings(scenario)
+    script_defaults(scenario['script'])
+    module = importlib.import_module(scripts[scenario['script']])
+    for key, value in scenario['settings'].items():
+        setattr(module, key, value)
+    return module
+
+
+def _run_snl(snl):
+    # returns {scenario name: result of analyse_snl} for all scenarios of the running job holding snl type *snl*
+    obs = parallel.get_shared()
+    out = {}
+    for scenario in _scenarios:
+        if snl not in scenario['settings']['snl_types']:
+            continue
+        print('\nScenario {0}'.format(scenario['name']))
+        n_records = len(profiling.records)
+        out[scenario['name']] = apply(scenario).analyse_snl(snl)
+        for rec in profiling.records[n_records:]:
+            rec['scenario'] = scenario['name']
+    obs.clear_results()
+    return out
+
+
+def run_jobs(path, n_workers=1, max_mb=8000):
+    # run all scenarios of job file *path*, with the snl types spread over *n_workers* processes. Returns list of
+    # {scenario name: result} per snl type
+    global _scenarios
+    _scenarios = read_jobs(path)
+    if n_workers > 1 and 'fork' not in mp.get_all_start_methods():
+        warnings.warn('\tScenarios need the fork start method for worker processes, running with n_workers=1')
+        n_workers = 1
+
+    for scenario in _scenarios:
+        out_dir = scenario['settings']['out_dir']
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+
+    # one session for all scenarios, with room for the query results of each scenario for a single snl type
+    obs = obs_session.ObsSession(max_mb=max_mb, max_results=len(_scenarios))
+    obs_filter = data_filter(_scenarios)
+    print('{0} scenarios from {1}, loading {2} at {3}'.format(len(_scenarios), path, obs_filter.to_query(),
+                                                               pgo.get_timestring('full')))
+    with profiling.stage('load') as rec:
+        obs.preload(obs_filter)
+        rec['rows'] = sum(obs.units[name][0].shape[0] for name in obs.units)
+
+    snl_types = list(dict.fromkeys(snl for scenario in _scenarios for snl in scenario['settings']['snl_types']))
+    results = parallel.run_per_type(_run_snl, snl_types, shared=obs, n_workers=n_workers)
+
+    for scenario in _scenarios:
+        module = apply(scenario)
+        if hasattr(module, 'write_all_tables') and scenario['settings'].get('print_all_tables'):
+            holder = [out[scenario['name']] for out in results if out.get(scenario['name']) is not None]
+            if holder:
+                print('\nScenario {0}, all snl types'.format(scenario['name']))
+                module.write_all_tables(holder)
+    return results
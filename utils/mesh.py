@@ -0,0 +1,82 @@
+# Bulk generation of the 250m hokken mesh and grid-arithmetic assignment of polygon zones (eg. provincies) to hokken.
+# All functions work on whole grids given by an affine and a shape (nrows, ncols), as read from the ascii grids.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import numpy as np
+import pandas as pd
+import shapely
+from rasterio import features
+from rasterio.transform import Affine
+
+from utils import grid
+
+
+def cell_topleft(affine, shape):
+    # returns arrays x_rd, y_rd of the top-left of all cells in the grid, in row-major order
+    x_rd, y_rd = grid.rowcol_to_topleft(affine, *grid.all_cells(shape))
+    return np.rint(x_rd).astype(np.int32), np.rint(y_rd).astype(np.int32)
+
+
+def cell_polygons(x_rd, y_rd, cellsize=250):
+    # returns array of square shapely polygons for arrays of cell top-left coordinates, built in one go
+    return shapely.box(x_rd, y_rd - cellsize, x_rd + cellsize, y_rd)
+
+
+def zone_fractions(zones, affine, shape, supersample=10, block_rows=100):
+    # Rasterize polygons in GeoDataFrame *zones* on the grid, each cell subdivided in supersample x supersample
+    # sub-cells. Returns arrays (cell, zone, fraction), one element per cell and zone that overlap, where cell is the
+    # flat row-major cell index, zone the positional index in *zones* and fraction the part of the cell covered by the
+    # zone (in steps of 1 / supersample**2). The grid is processed in strips of *block_rows* rows to bound memory.
+    if len(zones) > 254:
+        raise Exception('Sorry, zone_fractions supports at most 254 zones.')
+    nrows, ncols = shape
+    shapes = [(geom, i + 1) for i, geom in enumerate(zones.geometry)]  # 0 is outside all zones
+
+    cell_holder, zone_holder, frac_holder = [], [], []
+    for row0 in range(0, nrows, block_rows):
+        height = min(block_rows, nrows - row0)
+        strip_affine = affine * Affine.translation(0, row0) * Affine.scale(1 / supersample)
+        fine = features.rasterize(shapes, out_shape=(height * supersample, ncols * supersample),
+                                  transform=strip_affine, fill=0, dtype=np.uint8)
+        fine = fine.reshape(height, supersample, ncols, supersample)
+        for code in np.unique(fine):
+            if code == 0:
+                continue
+            count = (fine == code).sum(axis=(1, 3))
+            row, col = np.nonzero(count)
+            cell_holder.append((row + row0) * ncols + col)
+            zone_holder.append(np.full(row.size, code - 1, dtype=np.int16))
+            frac_holder.append((count[row, col] / supersample ** 2).astype(np.float32))
+
+    if not cell_holder:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int16), np.array([], dtype=np.float32)
+    cell, zone, fraction = np.concatenate(cell_holder), np.concatenate(zone_holder), np.concatenate(frac_holder)
+    order = np.lexsort((zone, cell))
+    return cell[order], zone[order], fraction[order]
+
+
+def dominant_zone(cell, zone, fraction, ncells):
+    # returns array of length *ncells* with the zone covering the largest part of each cell, -1 outside all zones
+    out = np.full(ncells, -1, dtype=np.int16)
+    order = np.lexsort((fraction, cell))  # per cell, the largest fraction comes last
+    cell, zone = cell[order], zone[order]
+    last = np.ones(cell.size, dtype=bool)
+    last[:-1] = cell[1:] != cell[:-1]
+    out[cell[last]] = zone[last]
+    return out
+
+
+def border_fractions(cell, zone, fraction):
+    # returns boolean mask of the (cell, zone, fraction) elements that belong to cells crossing a zone border, ie.
+    # cells that are not fully covered by a single zone
+    full = np.zeros(cell.max() + 1 if cell.size else 0, dtype=bool)
+    full[cell[fraction >= 1]] = True
+    return ~full[cell]
+
+
+def zone_table(cell, zone, fraction, zones, zone_col, affine, ncols):
+    # returns pandas dataframe with hok_id, zone name (from column *zone_col* of *zones*) and fraction, one row per
+    # (cell, zone) element
+    row, col = np.divmod(cell, ncols)
+    return pd.DataFrame({'hok_id': grid.rowcol_to_hok_id(affine, row, col), zone_col: zones[zone_col].values[zone],
+                         'fraction': fraction})
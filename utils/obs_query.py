@@ -0,0 +1,143 @@
+# Typed selection of PGO observations and planning of the selection against the observation sources. An ObsFilter
+# holds the allowed values per column. The planner compares it to the value domains of each source (which soortgroep,
+# soortlijst, periode and snl values a source can hold) and skips sources that cannot match, eg. the 32M row vogel
+# table for a vlinder query. The remaining sources are read in chunks with only the needed columns, each chunk is
+# filtered as soon as it is read, and predicates that hold for the whole source are not evaluated at all.
+# Domains come from the catalogue file written by build_catalogue, or else from the static pgo.obs_source_domains.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import json
+import os
+from dataclasses import dataclass, fields
+import pandas as pd
+
+from utils import asc_convert
+from utils import obs_schema
+from utils import grid
+from utils import obs_store
+
+filter_cols = ['periode', 'snl', 'soortlijst', 'soortgroep']
+chunksize = 2000000  # rows per chunk when reading a source
+
+
+@dataclass
+class ObsFilter:
+    # allowed values per column, None allows any value
+    periode: list = None
+    snl: list = None
+    soortlijst: list = None
+    soortgroep: list = None
+
+    def __post_init__(self):
+        for f in fields(self):
+            values = getattr(self, f.name)
+            if isinstance(values, str):
+                setattr(self, f.name, [values])
+            elif values is not None:
+                setattr(self, f.name, list(values))
+
+    @classmethod
+    def from_query(cls, query):
+        # returns ObsFilter for a query string as used by the analyse scripts, "snl in [...] & periode in [...]", or
+        # None when the query holds anything else than "&" separated "col in [...]" or "col == value" terms on
+        # filter_cols
+        selection = obs_store.parse_query(query)
+        if not selection or any(col not in filter_cols for col in selection):
+            return None
+        return cls(**selection)
+
+    def selection(self):
+        # returns dictionary of {column: [allowed values]} for the restricted columns
+        return {f.name: getattr(self, f.name) for f in fields(self) if getattr(self, f.name) is not None}
+
+    def to_query(self):
+        # returns the equivalent query string, for use with DataFrame.query
+        return ' & '.join('{0} in {1}'.format(col, values) for col, values in self.selection().items())
+
+    def can_match(self, domain):
+        # False if a source with value *domain* ({column: [values]}, columns not listed may hold any value) cannot
+        # hold any observation allowed by this filter
+        return all(set(values) & set(domain[col]) for col, values in self.selection().items() if col in domain)
+
+    def residual(self, domain):
+        # returns dictionary of the restrictions that are not met by all values in *domain*, ie. the predicates that
+        # need to be evaluated on a source with that domain
+        return {col: values for col, values in self.selection().items()
+                if col not in domain or not set(domain[col]) <= set(values)}
+
+    def mask(self, df, selection=None):
+        # returns boolean series of the rows of *df* allowed by this filter, or by *selection* if given
+        keep = pd.Series(True, index=df.index)
+        for col, values in (self.selection() if selection is None else selection).items():
+            keep &= df[col].isin(values)
+        return keep
+
+
+def as_filter(query):
+    # returns ObsFilter for *query*, which is an ObsFilter, a dictionary of {column: [allowed values]} or a query
+    # string. None if a query string cannot be expressed as ObsFilter
+    if isinstance(query, ObsFilter):
+        return query
+    if isinstance(query, dict):
+        unknown = [col for col in query if col not in filter_cols]
+        if unknown:
+            raise Exception('Sorry, cannot select observations on {0}, choose from {1}.'.format(
+                ', '.join(unknown), ', '.join(filter_cols)))
+        return ObsFilter(**query)
+    return ObsFilter.from_query(query)
+
+
+def build_catalogue(sources, path):
+    # scan the source csv files in dictionary *sources* {name: file} and write the values of filter_cols found in each
+    # to the JSON catalogue *path*, together with the file signature so that stale entries are recognized
+    catalogue = {}
+    for name, src in sources.items():
+        domain = {col: set() for col in filter_cols}
+        for chunk in pd.read_csv(src, comment='#', sep=';', usecols=filter_cols, chunksize=chunksize):
+            for col in filter_cols:
+                domain[col].update(chunk[col].unique())
+        catalogue[name] = {'source': src, 'signature': asc_convert.file_signature(src),
+                           'domain': {col: sorted(str(v) for v in values) for col, values in domain.items()}}
+        print('\t{0} catalogued: {1}'.format(name, ', '.join('{0} {1}'.format(len(v), k)
+                                                              for k, v in catalogue[name]['domain'].items())))
+    with open(path, 'w') as f:
+        json.dump(catalogue, f, indent=1)
+
+
+def source_domains(sources, catalogue_path, static_domains):
+    # returns dictionary {source name: domain} for *sources*. The domain of a source is read from the catalogue at
+    # *catalogue_path* when it holds an up-to-date entry for the source file, and otherwise taken from *static_domains*
+    catalogue = {}
+    if catalogue_path and os.path.isfile(catalogue_path):
+        with open(catalogue_path) as f:
+            catalogue = json.load(f)
+    out = {}
+    for name, src in sources.items():
+        entry = catalogue.get(name)
+        if entry and entry['source'] == src and os.path.isfile(src) and asc_convert.is_unchanged(src,
+                                                                                               entry['signature']):
+            out[name] = entry['domain']
+        else:
+            out[name] = static_domains.get(name, {})
+    return out
+
+
+def plan(obs_filter, domains):
+    # returns list of (source name, residual selection) for the sources in *domains* ({name: domain}) that may hold
+    # observations allowed by *obs_filter*, see ObsFilter.residual
+    return [(name, obs_filter.residual(domain)) for name, domain in domains.items() if obs_filter.can_match(domain)]
+
+
+def read_source(src, obs_filter, selection, columns):
+    # returns pandas dataframe of the rows of csv *src* allowed by *selection*, reading *columns* in chunks. Columns
+    # are typed as in utils/obs_schema.py, hok_id as integer hok_id
+    usecols = list(dict.fromkeys(list(columns) + list(selection)))
+    holder = []
+    for chunk in pd.read_csv(src, comment='#', sep=';', usecols=usecols, dtype=obs_schema.read_dtypes(usecols),
+                             chunksize=chunksize):
+        chunk = chunk[obs_filter.mask(chunk, selection)] if selection else chunk
+        chunk = obs_schema.apply_schema(chunk[list(columns)].copy())
+        if 'hok_id' in chunk.columns:
+            chunk['hok_id'] = grid.as_hok_id(chunk['hok_id'])
+        holder.append(chunk)
+    return obs_schema.concat(holder) if holder else pd.DataFrame(columns=columns)
@@ -0,0 +1,76 @@
+# Explicit column types of the PGO observation tables. Read as plain csv, periode, snl, soortlijst and soortgroep are
+# Python string objects (some 60 bytes per value) and n is int64, which for the 36M observations takes many GB.
+# With this schema the low-cardinality columns are categoricals (1 byte code per value), n is int16 and hok_id the
+# integer hok_id (int64, see grid.encode), together 14 bytes per observation instead of about 80.
+# Categories of periode, soortgroep and soortlijst are fixed, so that tables loaded separately have the same dtype and
+# concatenate without falling back to object. snl categories differ per table, concat() joins them to the union of
+# categories. All categories are kept in lexical order, the order of the string columns before, so that pivots and the
+# tables and GeoTIFF bands made from them keep their column order.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+categories = {'periode': ['1994-2001', '2002-2009', '2010-2017'],
+              'soortgroep': ['vaatplant', 'vlinder', 'vogel'],
+              'soortlijst': ['Bijl1', 'EcoSysLijst', 'SNL', 'VHR'],
+              'snl': None}  # None: categories as found in the data
+n_dtype = np.int16
+
+
+def read_dtypes(columns):
+    # returns dictionary of dtypes for pd.read_csv of *columns*. hok_id is not included, it may be read as string and
+    # is converted afterwards with grid.as_hok_id
+    out = {col: 'category' for col in categories if col in columns}
+    if 'n' in columns:
+        out['n'] = n_dtype
+    return out
+
+
+def apply_schema(df):
+    # convert the columns of observations dataframe *df* to the schema, in place, and return it. Values outside the
+    # fixed categories are kept, sorted in with the fixed categories
+    for col, cats in categories.items():
+        if col not in df.columns:
+            continue
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+        if cats is not None:
+            extra = sorted(str(c) for c in df[col].cat.categories if c not in cats)
+            df[col] = df[col].cat.set_categories(sorted(cats + extra))
+    if 'n' in df.columns and df['n'].dtype != n_dtype:
+        if df.shape[0] and (df['n'].max() > np.iinfo(n_dtype).max or df['n'].min() < np.iinfo(n_dtype).min):
+            raise Exception('Sorry, species counts n do not fit in {0}.'.format(np.dtype(n_dtype).name))
+        df['n'] = df['n'].astype(n_dtype)
+    return df
+
+
+def concat(frames):
+    # pd.concat of observation dataframes that keeps categorical columns categorical, by setting the categories of
+    # each categorical column to the union of its categories over all frames first. Note that *frames* are modified.
+    # The index is not kept, the result has a RangeIndex
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return pd.DataFrame()
+    cat_cols = [col for col in frames[0].columns
+                if all(col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype) for df in frames)]
+    for col in cat_cols:
+        union = union_categoricals([pd.Categorical([], categories=df[col].cat.categories) for df in frames],
+                                   sort_categories=True).categories
+        for df in frames:
+            if not df[col].cat.categories.equals(union):
+                df[col] = df[col].cat.set_categories(union)
+    return pd.concat(frames, ignore_index=True)
+
+
+def memory_mb(df):
+    # returns memory use of dataframe *df* in MB, including string contents of object columns
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def memory_summary(df):
+    # returns one line string with memory use of *df* in total and per observation
+    return '{0:.1f} MB, {1:.1f} bytes per record ({2})'.format(
+        memory_mb(df), df.memory_usage(deep=True).sum() / max(df.shape[0], 1),
+        ', '.join('{0} {1}'.format(col, dtype) for col, dtype in df.dtypes.astype(str).items()))
@@ -0,0 +1,176 @@
+# In-memory session cache of PGO observations, for scripts that query the observations repeatedly (eg. once per SNL
+# type). Data are loaded once per unit (a soortgroep partition of the obs store, or a source csv when there is no obs
+# store), with categorical dtypes and a precomputed row index per categorical column, so that repeated queries are
+# answered from memory. Optionally the results of the last *max_results* queries are kept as well, together with their
+# ObsCube, so that scenarios asking for the same selection share one query and one cube (see utils/jobs.py).
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import os
+import warnings
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from utils import cube
+from utils import grid
+from utils import obs_store
+from utils import obs_query
+from utils import obs_schema
+from utils import pgo
+
+index_cols = ['periode', 'snl', 'soortlijst', 'soortgroep']
+
+
+class ObsSession:
+    # Cache of observation data units with a memory cap of *max_mb* megabyte. Eviction policy is least-recently-used:
+    # when loading a unit would exceed the cap, the units that were queried longest ago are dropped first. Units needed
+    # by the running query are never evicted; a single unit larger than the cap is loaded anyway, with a warning.
+    # Query results are kept only when *max_results* > 0, they are shared between callers and must not be modified.
+
+    def __init__(self, max_mb=4000, columns=None, sources=None, store_dir=None, max_results=0):
+        self.max_bytes = max_mb * 1024 ** 2
+        self.columns = columns or ['periode', 'snl', 'n', 'hok_id', 'soortlijst', 'soortgroep']
+        self.sources = sources or pgo.obs_sources
+        self.store_dir = store_dir or pgo.obs_store_dir
+        self.units = OrderedDict()  # unit name: (dataframe, index, nbytes), in order of last use
+        self.max_results = max_results
+        self.results = OrderedDict()  # query key: [dataframe, ObsCube or None], in order of last use
+        self.n_loads = 0
+        self.n_evictions = 0
+
+    def nbytes(self):
+        # memory held by the session in bytes
+        return sum(nbytes for _, _, nbytes in self.units.values())
+
+    def unit_names(self):
+        # names of the loadable units: soortgroep partitions of the obs store, or else source csv files
+        if obs_store.store_exists(self.store_dir):
+            return [d.split('=', 1)[1] for d in sorted(os.listdir(self.store_dir)) if d.startswith('soortgroep=')]
+        return list(self.sources)
+
+    def _load_unit(self, name):
+        # read unit from disk, convert to categoricals and build per-column index
+        try:
+            if obs_store.store_exists(self.store_dir):
+                db = obs_store.read_obs_store(self.store_dir, selection={'soortgroep': [name]}, columns=self.columns)
+            else:
+                db = pd.read_csv(self.sources[name], comment='#', sep=';', usecols=self.columns,
+                                 dtype=obs_schema.read_dtypes(self.columns))
+                db['hok_id'] = grid.as_hok_id(db['hok_id'])
+        except OSError:
+            raise Exception('You\'re trying to open a files that lives only on the laptop of Hans Roelofsen, bad luck '
+                            'son.')
+        db.reset_index(drop=True, inplace=True)
+        obs_schema.apply_schema(db)
+
+        # index per categorical column: {value: sorted array of row positions having that value}
+        index = {}
+        for col in [c for c in index_cols if c in db.columns]:
+            codes = db[col].cat.codes.values
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(db[col].cat.categories) + 1))
+            index[col] = {cat: order[bounds[i]:bounds[i + 1]] for i, cat in enumerate(db[col].cat.categories)}
+
+        nbytes = db.memory_usage(deep=True).sum() + sum(pos.nbytes for idx in index.values() for pos in idx.values())
+        self.n_loads += 1
+        return db, index, nbytes
+
+    def _get_unit(self, name, keep):
+        # return cached unit, loading it first if needed. Units in *keep* are exempt from eviction
+        if name in self.units:
+            self.units.move_to_end(name)
+            return self.units[name]
+
+        db, index, nbytes = self._load_unit(name)
+        for old in [u for u in self.units if u not in keep]:
+            if self.nbytes() + nbytes <= self.max_bytes:
+                break
+            self.evict(old)
+        if self.nbytes() + nbytes > self.max_bytes:
+            warnings.warn('\tObsSession memory cap of {0:.0f} MB exceeded by unit {1}'.format(
+                self.max_bytes / 1024 ** 2, name))
+        self.units[name] = (db, index, nbytes)
+        return self.units[name]
+
+    def evict(self, name=None):
+        # drop unit *name* from the session, or the least recently used unit if no name is given
+        if name is None:
+            name = next(iter(self.units))
+        del self.units[name]
+        self.n_evictions += 1
+
+    def clear_results(self):
+        # drop all kept query results and cubes
+        self.results.clear()
+
+    def _result_key(self, query, obs_filter):
+        # key of *query* in self.results, identical for filters with the same values in any order
+        if obs_filter is None:
+            return query
+        return tuple(sorted((col, tuple(sorted(str(v) for v in values)))
+                            for col, values in obs_filter.selection().items()))
+
+    def _query_units(self, obs_filter):
+        # names of the units that may hold records for ObsFilter *obs_filter*, all units if it is None
+        names = self.unit_names()
+        if obs_filter is None:
+            return names
+        if obs_store.store_exists(self.store_dir):
+            return [name for name in names if obs_filter.can_match({'soortgroep': [name]})]
+        domains = obs_query.source_domains(self.sources, pgo.obs_catalogue, pgo.obs_source_domains)
+        return [name for name, _ in obs_query.plan(obs_filter, domains)]
+
+    def preload(self, query):
+        # load all units needed for *query* without querying them, eg. before handing the session to worker processes
+        names = self._query_units(obs_query.as_filter(query))
+        for name in names:
+            self._get_unit(name, keep=names)
+
+    def query(self, query):
+        # returns pandas dataframe of all observations complying to *query*, an obs_query.ObsFilter, dictionary or
+        # query string as for pgo.query_all_obs
+        obs_filter = obs_query.as_filter(query)
+        key = self._result_key(query, obs_filter)
+        if key in self.results:
+            self.results.move_to_end(key)
+            print('\tQuery result taken from the session')
+            return self.results[key][0]
+        selection = obs_filter.selection() if obs_filter is not None else {}
+        names = self._query_units(obs_filter)
+
+        holder = []
+        for name in names:
+            db, index, _ = self._get_unit(name, keep=names)
+            if obs_filter is None:
+                # query not expressible as ObsFilter, evaluate on the full unit
+                holder.append(db.query(query))
+                continue
+            if not selection or any(col not in index for col in selection):
+                holder.append(db[obs_filter.mask(db)])
+                continue
+            positions = None
+            for col, values in sorted(selection.items(), key=lambda item: len(item[1])):
+                col_pos = [index[col][v] for v in values if v in index[col]]
+                col_pos = np.sort(np.concatenate(col_pos)) if col_pos else np.array([], dtype=np.int64)
+                positions = col_pos if positions is None else np.intersect1d(positions, col_pos, assume_unique=True)
+            holder.append(db.take(positions))
+
+        out = obs_schema.concat(holder) if holder else pd.DataFrame(columns=self.columns)
+
+        pgo.print_obs_summary(out)
+        if self.max_results > 0:
+            while len(self.results) >= self.max_results:
+                self.results.popitem(last=False)
+            self.results[key] = [out, None]
+        return out
+
+    def cube(self, query, dat=None):
+        # returns cube.ObsCube of the observations complying to *query*, see query. *dat* is the result of
+        # query(query) when the caller has it already. The cube is kept with the query result, if that is kept
+        dat = self.query(query) if dat is None else dat
+        entry = self.results.get(self._result_key(query, obs_query.as_filter(query)))
+        if entry is None:
+            return cube.ObsCube(dat)
+        if entry[1] is None:
+            entry[1] = cube.ObsCube(dat)
+        return entry[1]
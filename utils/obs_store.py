@@ -0,0 +1,110 @@
+# Columnar storage of the PGO observation tables. The semicolon separated source tables are converted once to a Parquet
+# dataset partitioned by soortgroep/soortlijst/periode, so that queries only read the partitions and columns they need.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import ast
+import os
+import re
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import asc_convert
+from utils import grid
+from utils import obs_schema
+
+partition_cols = ['soortgroep', 'soortlijst', 'periode']
+store_cols = ['periode', 'snl', 'n', 'hok_id', 'soortlijst', 'soortgroep']
+
+
+def build_obs_store(sources, store_dir, chunksize=5000000):
+    # convert dictionary of {source name: csv file} to a Parquet dataset in *store_dir*, partitioned by partition_cols.
+    # Sources are read in chunks of *chunksize* rows, every chunk adds one file per partition it touches.
+    # snl is stored as dictionary (categorical) column, n as int16, hok_id as integer hok_id (see grid.encode).
+    for name, src in sources.items():
+        print('{0} to obs store in progress'.format(name))
+        reader = pd.read_csv(src, comment='#', sep=';', usecols=store_cols, chunksize=chunksize)
+        for i, chunk in enumerate(reader):
+            chunk['snl'] = chunk['snl'].astype('category')
+            chunk['n'] = chunk['n'].astype(obs_schema.n_dtype)
+            chunk['hok_id'] = grid.as_hok_id(chunk['hok_id'])
+            pq.write_to_dataset(pa.Table.from_pandas(chunk, preserve_index=False), root_path=store_dir,
+                                partition_cols=partition_cols, basename_template=name + '-' + str(i) + '-{i}.parquet',
+                                existing_data_behavior='overwrite_or_ignore')
+            print('\tDone with {0} rows'.format(chunk.shape[0]))
+
+
+def store_exists(store_dir):
+    # True if the obs store has been built in *store_dir*
+    return os.path.isdir(store_dir) and any(d.startswith(partition_cols[0] + '=') for d in os.listdir(store_dir))
+
+
+def parse_query(query):
+    # Translate a query string as used by the analyse scripts, ie. "snl in [...] & periode in [...]", to a dictionary
+    # of {column: [allowed values]}. Returns empty dict when the query contains anything else than "&" separated
+    # "col in [...]" or "col == value" terms, so that the caller falls back to reading everything
+    selection = {}
+    for term in query.split('&'):
+        match = re.fullmatch(r'\s*(\w+)\s*(in|==)\s*(.+?)\s*', term)
+        if match is None:
+            return {}
+        col, op, value = match.groups()
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return {}
+        selection[col] = list(value) if op == 'in' else [value]
+    return selection
+
+
+def read_obs_store(store_dir, selection=None, columns=None):
+    # return pandas dataframe from the obs store, reading only *columns* and the partitions allowed by *selection*,
+    # a dictionary of {column: [allowed values]}
+    filters = [(col, 'in', values) for col, values in (selection or {}).items()]
+    db = pd.read_parquet(store_dir, columns=columns, filters=filters or None)
+    # partition columns are read back as categoricals of the values found, set them to the schema categories
+    return obs_schema.apply_schema(db)
+
+
+def partition_dir(store_dir, key):
+    # directory of partition *key*, a tuple of values of the partition_cols
+    return os.path.join(store_dir, *['{0}={1}'.format(col, value) for col, value in zip(partition_cols, key)])
+
+
+def replace_partitions(store_dir, db, keys, name):
+    # replace partitions *keys* (tuples of soortgroep, soortlijst, periode) of the obs store with the rows of
+    # dataframe *db* that fall in them. Other partitions are left as they are
+    keys = set(keys)
+    for key in keys:
+        shutil.rmtree(partition_dir(store_dir, key), ignore_errors=True)
+    in_keys = pd.MultiIndex.from_frame(db[partition_cols].astype(str)).isin(list(keys))
+    db = db.loc[in_keys, store_cols].copy()
+    if db.empty:
+        return
+    db['snl'] = db['snl'].astype(str).astype('category')
+    db['n'] = db['n'].astype(obs_schema.n_dtype)
+    db['hok_id'] = grid.as_hok_id(db['hok_id'])
+    pq.write_to_dataset(pa.Table.from_pandas(db, preserve_index=False), root_path=store_dir,
+                        partition_cols=partition_cols, basename_template=name + '-{i}.parquet',
+                        existing_data_behavior='overwrite_or_ignore')
+
+
+def replace_soortgroep(store_dir, db, soortgroep, name):
+    # replace all partitions of *soortgroep* in the obs store with the rows of dataframe *db*
+    shutil.rmtree(os.path.join(store_dir, '{0}={1}'.format(partition_cols[0], soortgroep)), ignore_errors=True)
+    keys = db[partition_cols].astype(str).drop_duplicates().itertuples(index=False, name=None)
+    replace_partitions(store_dir, db, list(keys), name)
+
+
+def update_from_grids(store_dir, bin_dir, manifest, changed, name):
+    # rewrite the partitions of the obs store touched by the *changed* entries of the species grid *manifest* in
+    # *bin_dir* (see asc_convert.update_dir), from all grids in the manifest that belong to these partitions
+    keys = {(entry['soortgroep'], entry['soortlijst'], entry['periode']) for entry in changed}
+    if not keys:
+        return
+    grids = [asc_convert.read_grid(bin_dir, entry) for entry in manifest
+             if (entry['soortgroep'], entry['soortlijst'], entry['periode']) in keys]
+    db = pd.concat(grids) if grids else pd.DataFrame(columns=store_cols)
+    replace_partitions(store_dir, db, keys, name)
+    print('\t{0} obs store partition(s) updated from {1}'.format(len(keys), bin_dir))
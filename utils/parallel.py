@@ -0,0 +1,51 @@
+# Process-pool execution of independent per-SNL-type analyses. Data shared by all tasks (typically an ObsSession with
+# the observations already loaded) is handed to each worker process once, not pickled per task:
+#  - where the fork start method is available (Linux) workers inherit it copy-on-write from the parent,
+#  - elsewhere (Windows) it is passed once per worker through the pool initializer.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import multiprocessing as mp
+
+from utils import profiling
+
+_shared = None
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _call(args):
+    # returns the result and the stage records of the task, see utils/profiling.py
+    func, item = args
+    profiling.pop_records()  # forked workers inherit the records of the parent
+    result = func(item)
+    return result, profiling.pop_records()
+
+
+def get_shared():
+    # return the shared data in the current process, see run_per_type
+    return _shared
+
+
+def run_per_type(func, types, shared=None, n_workers=1):
+    # returns [func(t) for t in *types*], run over a pool of *n_workers* processes. Results are in the order of
+    # *types*, regardless of which worker finished first. *func* must be a module level function, it can retrieve
+    # *shared* with get_shared(). n_workers=1 runs in the current process, without a pool. Stage records made in the
+    # workers are added to profiling.records of this process.
+    global _shared
+    _shared = shared
+    if n_workers == 1 or len(types) <= 1:
+        return [func(t) for t in types]
+
+    n_workers = min(n_workers, len(types))
+    if 'fork' in mp.get_all_start_methods():
+        pool = mp.get_context('fork').Pool(processes=n_workers)
+    else:
+        pool = mp.get_context('spawn').Pool(processes=n_workers, initializer=_init_worker, initargs=(shared,))
+    with pool:
+        out = pool.map(_call, [(func, t) for t in types], chunksize=1)
+    for _, recs in out:
+        profiling.records.extend(recs)
+    return [result for result, _ in out]
@@ -3,26 +3,92 @@
 
 import os
 import warnings
-import datetime
 import numpy as np
 import matplotlib.patches as mpatches
 import matplotlib.pyplot as plt
 import geopandas as gp
 import pandas as pd
-import pickle
 import rasterio as rio
 
+from utils import grid
+from utils import obs_store
+from utils import obs_query
+from utils import obs_schema
+from utils import provincie
+from utils import snl_matrix
+from utils import timestamps
+
+# observation tables as produced by prepare_data/prep_asc.py and prep_vlinder.py, hard-coded to Hans Roelofsen laptop
+obs_sources = {'vlinder': r'd:\hotspot_working\c_vlinders\vlinder_all_v2.txt',
+               'plant_snl': r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all_snl.csv',
+               'plant_bijl1': r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all_Bijl1.csv',
+               'plant_vhr': r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all_VHR.csv',
+               'plant_eco': r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all_EcoSysLijst.csv',
+               'vogel': r'd:\hotspot_working\a_broedvogels\Soortenrijkdom\Species_richness\vogel_all4.csv'}
+
+# values of the filter columns each source can hold, for skipping sources that cannot match a query (see
+# utils/obs_query.py). Columns not listed may hold any value. The catalogue written by prepare_data/prep_obs_store.py
+# lists all columns and takes precedence
+obs_source_domains = {'vlinder': {'soortgroep': ['vlinder']},
+                      'plant_snl': {'soortgroep': ['vaatplant'], 'soortlijst': ['SNL']},
+                      'plant_bijl1': {'soortgroep': ['vaatplant'], 'soortlijst': ['Bijl1']},
+                      'plant_vhr': {'soortgroep': ['vaatplant'], 'soortlijst': ['VHR']},
+                      'plant_eco': {'soortgroep': ['vaatplant'], 'soortlijst': ['EcoSysLijst']},
+                      'vogel': {'soortgroep': ['vogel']}}
+obs_catalogue = r'd:\hotspot_working\obs_catalogue.json'
+
+# full observation tables read by get_all_obs and iter_all_obs
+all_obs_sources = [r'd:\hotspot_working\a_broedvogels\Soortenrijkdom\Species_richness\vogel_all2.csv',
+                   r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all2.csv',
+                   r'd:\hotspot_working\c_vlinders\vlinder_all.txt']
+
+# Parquet version of obs_sources, see prepare_data/prep_obs_store.py
+obs_store_dir = r'd:\hotspot_working\obs_store'
+
+
+def encode_hok_id(x_rd, y_rd):
+    # Return integer hok_id for arrays of x_rd, y_rd (RD New coordinates of the cell top-left). The hok_id is the
+    # coordinate pair packed into one int64 as x_rd * 1e6 + y_rd, which is unique because 0 <= y_rd < 1e6 in RD New.
+    # See utils/grid.py
+    return grid.encode(x_rd, y_rd)
+
+
+def decode_hok_id(hok_id):
+    # Return arrays x_rd, y_rd of the cell top-left for array of integer hok_ids
+    return grid.decode(hok_id)
+
+
+def hok_id_to_str(hok_id):
+    # Return string form "{x_rd}_{y_rd}" of integer hok_ids. Use for export only! See grid.to_str
+    return grid.to_str(hok_id)
+
+
+def hok_id_from_str(hok_id):
+    # Return integer hok_ids for series of string hok_ids "{x_rd}_{y_rd}"
+    return grid.from_str(hok_id)
+
+
+def as_hok_id(hok_id):
+    # Return series of integer hok_ids, converting from the string form if needed (eg. tables written before the
+    # integer hok_id was introduced)
+    return grid.as_hok_id(hok_id)
+
+
+def get_grid(dir_in=r'd:\hotspot_working\a_broedvogels\SNL_grids', asc_in='Heide.asc'):
+    # return affine and shape (nrows, ncols) of the 250m grid, from the specs of an example ascii grid. Defaults to the
+    # ascii grid used for the 250m mesh, see prepare_data/create_250m_mesh.py
+    return grid.from_asc(dir_in, asc_in)
+
 
 def get_specs(dir_in, asc_in):
-    # Return specs of ASC grid file as a dictionary
-    specs = {}
-    with open(os.path.join(dir_in, asc_in), 'r') as f:
-        for line in f.readlines():
-            if not line.startswith('-9999'):
-                specs[line.split(' ')[0]] = line.split(' ')[1]
-    for k,v in specs.items():
-        specs[k] = np.int32(np.float32(v))
-    return specs
+    # Return specs of ASC grid file as a dictionary, see grid.read_specs
+    return grid.read_specs(dir_in, asc_in)
+
+
+def grid_nonempty_cells(vals, nodata):
+    # Return row, col indices and values of the cells in 2D array *vals* that are neither zero nor NoData, in
+    # row-major order, ie the same order as the former reshape(..., order='C'). See grid.nonempty_cells
+    return grid.nonempty_cells(vals, nodata)
 
 
 def ascii_species_grid_to_pd(dir_in, asc_in):
@@ -32,9 +98,13 @@ def ascii_species_grid_to_pd(dir_in, asc_in):
     specs = get_specs(dir_in, asc_in)
     asc = rio.open(os.path.join(dir_in, asc_in))
 
-    # reshape grid nrows*ncols to list of length nrows*ncols
-    # order = 'C' means that values are read per row, ie last index changes fastest!
-    vals = np.reshape(asc.read(1), newshape=np.product(asc.shape), order='C').astype(np.int16)
+    # mask first: keep only cells where n is neither zero nor NoData, so that everything below is done on the
+    # non-empty cells only.
+    # row indices range from 0 up to and including specs['NROWS'] -1
+    # col indices range from 0 up to and including specs['NCOLS'] -1
+    # although row, col indices are integers (ie 'blocks'), note that row, col (0,0) refers to cell top-left in
+    # Cartesian space
+    row, col, vals = grid_nonempty_cells(asc.read(1).astype(np.int16), specs['NODATA_value'])
 
     # new dataframe where:
     #  n = values read from the ascii grid
@@ -42,24 +112,17 @@ def ascii_species_grid_to_pd(dir_in, asc_in):
     #  snl = snl beheertype, as inferred from file name
     #  periode = periode to which data applies, as inferred from file name
     #  soortlijst = species list to which data applies, as inferred from file name
-    db = pd.DataFrame({'n': vals, 'soortgroep': groep, 'snl':snl, 'periode':periode, 'soortlijst':soortlijst})
-
-    # Add Row, Col indices to each row in the dataframe
-    # row indices range from 0 up to and including specs['NROWS'] -1
-    # col indices range from 0 up to and including specs['NCOLS'] -1
-    # although row, col indices are integers (ie 'blocks'), note that row, col (0,0) refers to cell top-left in
-    # Cartesian space
-    db['row'] = np.array([[i] * specs['NCOLS'] for i in range(0, specs['NROWS'])]).reshape(np.product(asc.shape))
-    db['col'] = np.array([i for i in range(0, specs['NCOLS'])] * specs['NROWS']).reshape(np.product(asc.shape))
-
-    # drop rows where n is either zero or NoData
-    db.drop(db.loc[(db['n'] == specs['NODATA_value']) | (db['n'] == 0)].index, axis=0, inplace=True)
+    # index is the position of the cell in the grid flattened row-wise (order='C'), as before
+    db = pd.DataFrame({'n': vals, 'soortgroep': groep, 'snl': snl, 'periode': periode, 'soortlijst': soortlijst,
+                       'row': row, 'col': col}, index=row * specs['NCOLS'] + col)
 
     # Calculate Cartesian (ie RD New coordinates) based on the row, col indices, meaning that they refer to the
     # cell top-left!!
-    db['x_rd'] = db.apply(lambda x: ((x.col, x.row) * asc.affine)[0], axis=1).astype(np.int32)
-    db['y_rd'] = db.apply(lambda x: ((x.col, x.row) * asc.affine)[1], axis=1).astype(np.int32)
-    db['hok_id'] = db.apply(lambda x: str(x.x_rd) + '_' + str(x.y_rd), axis=1)
+    affine = grid.from_specs(specs)[0]
+    x_rd, y_rd = grid.rowcol_to_topleft(affine, row, col)
+    db['x_rd'] = x_rd.astype(np.int32)
+    db['y_rd'] = y_rd.astype(np.int32)
+    db['hok_id'] = grid.rowcol_to_hok_id(affine, row, col)
     return db
 
 
@@ -67,83 +130,140 @@ def ascii_snl_grid_to_pd(dir_in, asc_in):
     specs = get_specs(dir_in, asc_in)
     asc = rio.open(os.path.join(dir_in, asc_in))
 
-    # reshape grid nrows*ncols to list of length nrows*ncols
-    # order = 'C' means that values are read per row, ie last index changes fastest!
-    vals = np.reshape(asc.read(1), newshape=np.product(asc.shape), order='C').astype(np.int32)
-
-    db = pd.DataFrame({'area_m2': vals})
-    print(db.describe())
     # row indices range from 0 up to and including specs['NROWS'] -1
     # col indices range from 0 up to and including specs['NCOLS'] -1
     # although row, col indices are integers (ie 'blocks'), note that row, col (0,0) refers to cell top-left in
     # Cartesian space
-    db['row'] = np.array([[i] * specs['NCOLS'] for i in range(0, specs['NROWS'])]).reshape(np.product(asc.shape))
-    db['col'] = np.array([i for i in range(0, specs['NCOLS'])] * specs['NROWS']).reshape(np.product(asc.shape))
-    db.drop(db.loc[(db['area_m2'] == specs['NODATA_value']) | (db['area_m2'] == 0)].index, axis=0, inplace=True)
+    row, col, vals = grid_nonempty_cells(asc.read(1).astype(np.int32), specs['NODATA_value'])
+
+    db = pd.DataFrame({'area_m2': vals}, index=row * specs['NCOLS'] + col)
+    print(db.describe())
+
     # note that coordinates are calculated for the row,col indices, which means they apply to the cell top-left!
-    db['x_rd'] = db.apply(lambda x: ((x.col, x.row) * asc.affine)[0], axis=1).astype(np.int32)
-    db['y_rd'] = db.apply(lambda x: ((x.col, x.row) * asc.affine)[1], axis=1).astype(np.int32)
-    db['hok_id'] = db.apply(lambda x: str(x.x_rd) + '_' + str(x.y_rd), axis=1)
+    db['hok_id'] = grid.rowcol_to_hok_id(grid.from_specs(specs)[0], row, col)
 
-    return db.drop(['row', 'col', 'x_rd', 'y_rd'], axis=1)
+    return db
 
 
 def query_all_obs(query):
-    # returns pandas dataframe of all observations, file locations are hard-coded
+    # returns pandas dataframe of all observations complying to *query*, file locations are hard-coded. *query* is an
+    # obs_query.ObsFilter, a dictionary of {column: [allowed values]} or a query string like
+    # "snl in [...] & periode in [...]".
+    # Reads from the columnar obs store if it exists, only reading the partitions and columns touched by the query.
+    # Otherwise reads only the source csv files that can hold matching observations, see utils/obs_query.py. Query
+    # strings that cannot be expressed as ObsFilter are evaluated with DataFrame.query on all sources.
 
     relevant_cols = ['periode', 'snl', 'n', 'hok_id', 'soortlijst', 'soortgroep']
+    obs_filter = obs_query.as_filter(query)
 
     try:
-        vlinder = pd.read_csv(r'd:\hotspot_working\c_vlinders\vlinder_all_v2.txt', comment='#', sep=';',
-                              usecols=relevant_cols)
-
-        plant_snl = pd.read_csv(r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all_snl.csv',
-                            comment='#', sep=';', usecols=relevant_cols)
+        if obs_filter is None:
+            if obs_store.store_exists(obs_store_dir):
+                out = obs_store.read_obs_store(obs_store_dir, columns=relevant_cols).query(query)
+            else:
+                out = obs_schema.concat([pd.read_csv(src, comment='#', sep=';', usecols=relevant_cols,
+                                                     dtype=obs_schema.read_dtypes(relevant_cols)).query(query)
+                                         for src in obs_sources.values()])
+        elif obs_store.store_exists(obs_store_dir):
+            out = obs_store.read_obs_store(obs_store_dir, selection=obs_filter.selection(), columns=relevant_cols)
+        else:
+            domains = obs_query.source_domains(obs_sources, obs_catalogue, obs_source_domains)
+            holder = [obs_query.read_source(obs_sources[name], obs_filter, selection, relevant_cols)
+                      for name, selection in obs_query.plan(obs_filter, domains)]
+            out = obs_schema.concat(holder) if holder else pd.DataFrame({col: [] for col in relevant_cols},
+                                                                        dtype=np.int64)
+        out['hok_id'] = as_hok_id(out['hok_id'])
+        obs_schema.apply_schema(out)
+
+        print_obs_summary(out)
+        return out
 
-        plant_bijl1 = pd.read_csv(r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all_Bijl1.csv',
-                            comment='#', sep=';', usecols=relevant_cols)
+    except OSError:
+        raise Exception('You\'re trying to open a files that lives only on the laptop of Hans Roelofsen, bad luck son.')
 
-        plant_vhr = pd.read_csv(r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all_VHR.csv',
-                            comment='#', sep=';', usecols=relevant_cols)
 
-        plant_eco = pd.read_csv(r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all_EcoSysLijst.csv',
-                            comment='#', sep=';', usecols=relevant_cols)
+def print_obs_summary(out):
+    # print number of records and the sets of periode, snl, soortlijst and soortgroep in observation dataframe *out*
+    print('\tFound {0} records complying to query'.format(out.shape[0]))
+    print('\t\tSet periode: {0}'.format(set(out.periode)))
+    print('\t\tSet snl: {0}'.format(set(out.snl)))
+    print('\t\tSet soortlijst: {0}'.format(set(out.soortlijst)))
+    print('\t\tSet soortgroep: {0}'.format(set(out.soortgroep)))
+    print('\t\tMemory: {0}'.format(obs_schema.memory_summary(out)))
 
-        vogel = pd.read_csv(r'd:\hotspot_working\a_broedvogels\Soortenrijkdom\Species_richness\vogel_all4.csv',
-                            comment='#', sep=';', usecols=relevant_cols)
 
-        out = pd.concat([vlinder.query(query), plant_snl.query(query), plant_bijl1.query(query),
-                          plant_vhr.query(query), plant_eco.query(query), vogel.query(query)])
+def get_all_obs():
+    # returns pandas dataframe of all observations, file locations are hard-coded
 
-        print('\tFound {0} records complying to query'.format(out.shape[0]))
-        print('\t\tSet periode: {0}'.format(set(out.periode)))
-        print('\t\tSet snl: {0}'.format(set(out.snl)))
-        print('\t\tSet soortlijst: {0}'.format(set(out.soortlijst)))
-        print('\t\tSet soortgroep: {0}'.format(set(out.soortgroep)))
+    warnings.warn('You\'re trying to load ALL observations (32.433.656 Vogels, 814.624 Vlinders and 2.818.828 Planten)'
+                  ', that is probably a bad idea. Use query_all_obs, iter_all_obs or aggregate_all_obs instead')
 
+    try:
+        dtypes = {col: 'category' for col in obs_schema.categories}
+        out = obs_schema.concat([obs_schema.apply_schema(pd.read_csv(src, comment='#', sep=';', dtype=dtypes))
+                                 for src in all_obs_sources])
+        print('\tLoaded all observations: {0}'.format(obs_schema.memory_summary(out)))
         return out
 
     except OSError:
         raise Exception('You\'re trying to open a files that lives only on the laptop of Hans Roelofsen, bad luck son.')
 
 
-def get_all_obs():
-    # returns pandas dataframe of all observations, file locations are hard-coded
-
-    warnings.warn('You\'re trying to load ALL observations (32.433.656 Vogels, 814.624 Vlinders and 2.818.828 Planten)'
-                  ', that is probably a bad idea. Use query_all_obs instead')
+def iter_all_obs(query=None, columns=None, memory_mb=500):
+    # yields all observations as pandas dataframes of bounded size, as alternative to get_all_obs. Each chunk is read
+    # from the source files, filtered with *query* and reduced to *columns* before it is yielded. The chunk size is
+    # chosen so that one chunk as read from file takes about a quarter of *memory_mb* megabyte. Chunks are typed as in
+    # utils/obs_schema.py.
+    usecols = None
+    if columns is not None:
+        selection = obs_store.parse_query(query) if query else {}
+        if query and not selection:
+            usecols = None  # query not understood, read all columns so that the query can be evaluated
+        else:
+            usecols = list(dict.fromkeys(list(columns) + list(selection)))
 
     try:
-        vlinder = pd.read_csv(r'd:\hotspot_working\c_vlinders\vlinder_all.txt', comment='#', sep=';')
-        plant = pd.read_csv(r'd:\hotspot_working\b_vaatplanten\Soortenrijkdom\vaatplant_all2.csv', comment='#', sep=';')
-        vogel = pd.read_csv(r'd:\hotspot_working\a_broedvogels\Soortenrijkdom\Species_richness\vogel_all2.csv',
-                            comment='#', sep=';')
-        return pd.concat([vogel, plant, vlinder])
+        for src in all_obs_sources:
+            # estimate memory per row from a sample to set the chunk size
+            dtypes = {col: 'category' for col in obs_schema.categories}
+            sample = pd.read_csv(src, comment='#', sep=';', usecols=usecols, dtype=dtypes, nrows=10000)
+            row_bytes = sample.memory_usage(deep=True).sum() / max(sample.shape[0], 1)
+            chunksize = max(int(memory_mb * 1024 ** 2 / 4 / row_bytes), 1000)
+
+            for chunk in pd.read_csv(src, comment='#', sep=';', usecols=usecols, dtype=dtypes, chunksize=chunksize):
+                if query:
+                    chunk = chunk.query(query)
+                if columns is not None:
+                    chunk = chunk[list(columns)]
+                chunk = obs_schema.apply_schema(chunk.copy())
+                if 'hok_id' in chunk.columns:
+                    chunk['hok_id'] = as_hok_id(chunk['hok_id'])
+                yield chunk
 
     except OSError:
         raise Exception('You\'re trying to open a files that lives only on the laptop of Hans Roelofsen, bad luck son.')
 
 
+def aggregate_all_obs(by=('hok_id', 'periode'), query=None, memory_mb=500):
+    # returns pandas series of the summed n over all observations, grouped by *by*, eg. per hok_id per periode.
+    # Observations are read through iter_all_obs and aggregated chunk by chunk. Partial aggregates are merged as soon
+    # as they take more than a quarter of *memory_mb*, or, once the merged aggregate itself is larger than that, twice
+    # the merged aggregate, so that each merge at least halves what is held and no chunk is merged over and over.
+    # *memory_mb* bounds the chunks and the partial aggregates, not the aggregate, which is as large as the result.
+    by = list(by)
+    holder, held_bytes, merged_bytes = [], 0, 0
+    for chunk in iter_all_obs(query=query, columns=by + ['n'], memory_mb=memory_mb):
+        part = chunk.assign(n=chunk['n'].astype(np.int64)).groupby(by, sort=False, observed=True)['n'].sum()
+        holder.append(part)
+        held_bytes += part.memory_usage(deep=True)
+        if held_bytes > max(memory_mb * 1024 ** 2 / 4, 2 * merged_bytes):
+            holder = [pd.concat(holder).groupby(level=by, sort=False, observed=True).sum()]
+            held_bytes = merged_bytes = holder[0].memory_usage(deep=True)
+    if not holder:
+        return pd.Series(dtype=np.int64, name='n')
+    return pd.concat(holder).groupby(level=by, observed=True).sum()
+
+
 def diff_to_png(gdf, title, comment, col, cats, cat_cols, background, background_cells, out_dir, out_name):
     # Plot map of difference categorieen
 
@@ -193,8 +313,11 @@ def parse_soort_sel(x):
 
 def get_250m_hokken():
     # return GeoDataFrame of 250m hokken, assumes fixed location. Provincie is one of attributes
+    # ID is the string hok_id as written to the shapefile, hok_id the integer hok_id for joining
     try:
-        return gp.read_file(r'd:\hotspot_working\shp_250mgrid\hok250m_fullextent.shp')
+        hokken = gp.read_file(r'd:\hotspot_working\shp_250mgrid\hok250m_fullextent.shp')
+        hokken['hok_id'] = hok_id_from_str(hokken['ID'])
+        return hokken
     except OSError:
         raise Exception('You\'re trying to open a shapefile that lives only on the laptop of Hans Roelofsen.')
 
@@ -207,6 +330,36 @@ def classifier(x, categories, labels):
         raise Exception('Sorry, requested value {0} is not found in any of the ranges.'.format(x))
 
 
+def range_edges(categories):
+    # returns bin edges for list of contiguous, increasing ranges with step 1, eg. [range(-4, 0), range(0, 1)] gives
+    # [-4, 0, 1]
+    for cat_range, next_range in zip(categories[:-1], categories[1:]):
+        if cat_range.stop != next_range.start or cat_range.step != 1:
+            raise Exception('Sorry, ranges {0} and {1} are not contiguous.'.format(cat_range, next_range))
+    return [cat_range.start for cat_range in categories] + [categories[-1].stop]
+
+
+def classify(x, categories, labels):
+    # Vectorised classifier: returns pandas Categorical with the corresponding label for each value in array *x*.
+    # *categories* is either a list of contiguous ranges (as for classifier) or a list of len(labels) + 1 increasing bin
+    # edges, where bin i holds edges[i] <= x < edges[i + 1]. As in classifier, values are truncated to integers first
+    # when categories are ranges
+    if all(isinstance(cat, range) for cat in categories):
+        edges = range_edges(categories)
+        x = np.trunc(np.asarray(x, dtype=np.float64))
+    else:
+        edges = categories
+        x = np.asarray(x, dtype=np.float64)
+    if len(edges) != len(labels) + 1:
+        raise Exception('Sorry, {0} labels do not match {1} bin edges.'.format(len(labels), len(edges)))
+
+    codes = np.searchsorted(edges, x, side='right') - 1
+    outside = (codes < 0) | (codes >= len(labels)) | np.isnan(x)
+    if outside.any():
+        raise Exception('Sorry, requested value {0} is not found in any of the ranges.'.format(x[outside][0]))
+    return pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+
+
 def ecosys_2_beheer(snl_code):
     trans = {'Moeras': ['N0501', 'N0502', 'N0601', 'N0602'],
              'Heide': ['N0603', 'N0604', 'N0605', 'N0606', 'N0701', 'N0702'],
@@ -224,50 +377,26 @@ def ecosys_2_beheer(snl_code):
 
 
 def get_timestring(timetype):
-    t0 = datetime.datetime.now()
-    if timetype == 'full':
-        return t0.strftime("%Y-%m-%d_%H:%M:%S")
-    elif timetype == 'brief':
-        return t0.strftime("%y%m%d-%H%M")
-    else:
-        return t0
+    # see utils/timestamps.py
+    return timestamps.get_timestring(timetype)
 
 
 def get_snl_hokids(snl, treshold):
     # function to get df of 250m hokken from *snl* beheertypes and/or ecosysteemtypes where the area exceeds *treshold*
-    # returns df where: hok_id = hok_id, snl_count = aantal snl types aanwezig in hok, prov=provincie
-    # reads pickled PD dataframes of of snl type, hard-coded to Hans Roelofsen laptop
+    # returns df where: hok_id = hok_id, snl_count = aantal snl types aanwezig in hok, snl_area_m2 = summed area of
+    # these snl types, provincie = provincie covering the largest part of the hok (see utils/provincie.py), one row per
+    # hok. snl='all' returns all hokken with any SNL beheertype.
+    # reads the precomputed sparse hok x snl type matrix, see utils/snl_matrix.py
 
     # always iterate of the requested snl types
     if not isinstance(snl, list):
         snl = [snl]
 
-    # read and concatenate all requested snl type pickles
-    holder = []
-    augurken_dir = r'd:\hotspot_working\a_broedvogels\SNL_grids\augurken'
-    for snl_type in snl:
-        if snl_type == 'all':
-            raise Exception('You are requesting a table of all 250m hokken, not just of all SNL hokken. Beware!')
-        with open(os.path.join(augurken_dir, snl_type + '.pkl'), 'rb') as handle:
-            df = pickle.load(handle)
-            holder.append(df.loc[df['area_m2'] >= treshold, :])
-    snl_dat = pd.concat(holder)
-
     # Note: SNL grid data are already cleansed from cells with -9999 (NoData) and 0 sq m2 area. See prep_asc.py
+    foo = snl_matrix.snl_hokids(snl, treshold)
 
-    # read provincien
-    with open(os.path.join(augurken_dir, 'provincien.pkl'), 'rb') as handle:
-        raise Exception('Sorry, you must fix the Provincien pkl first. provincien.pkl does not include the new'
-                        'Utrecht AND contains > 1 provincie per hok.')
-        prov = pickle.load(handle)
-
-    # pivot on hok_id and report number of snl types per hok_id
-    print('\t\tFound {0} cells from {1} SNL type(s) with area gte {2}'.format(len(set(snl_dat['hok_id'])),
-                                                                              len(snl), str(treshold)))
-
-    foo = pd.DataFrame(pd.pivot_table(data=snl_dat, index='hok_id', values='area_m2',
-                                      aggfunc={'area_m2': ['count', 'sum']})).rename(columns={'count': 'snl_count',
-                                                                                              'sum': 'snl_area_m2'})
-
-    return pd.merge(left=foo, right=prov, left_index=True, right_on='hok_id', how='inner')
+    print('\t\tFound {0} cells from {1} SNL type(s) with area gte {2}'.format(foo.shape[0],
+                                                                           len(snl_matrix.resolve(snl)), str(treshold)))
 
+    foo['provincie'] = provincie.dominant_provincie(foo['hok_id'].values)
+    return foo
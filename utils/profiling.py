@@ -0,0 +1,166 @@
+# Timing and memory instrumentation of the pipeline stages (load, filter, pivot, merge, classify, render, write).
+# Wrap a stage in a context manager or decorate the function doing it:
+#     with profiling.stage('pivot', snl) as rec:
+#         dat_piv = ...
+#         rec['rows'] = dat_piv.shape[0]
+# Each finished stage adds a record with wall time, CPU time, peak RSS and row count to *records*, write_report dumps
+# the records of a run to JSON or CSV. Set *profile_dir* to also keep a cProfile dump (readable with pstats or
+# snakeviz) of the slowest stage per process.
+# Peak RSS is sampled every *sample_interval* s during the stage when psutil is installed, without psutil it is the
+# high-water mark of the process so far (resource module, not on Windows).
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import cProfile
+import contextlib
+import functools
+import json
+import os
+import platform
+import threading
+import time
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from utils import timestamps
+
+records = []  # one dictionary per finished stage in this process
+profile_dir = None  # directory for cProfile dump of the slowest stage, None for no profiling
+sample_interval = 0.05  # seconds between RSS samples
+
+_depth = 0  # nesting level of running stages, only outermost stages are profiled
+_slowest = {'wall_s': -1, 'profile': None}
+
+
+def rss_mb():
+    # returns current resident set size of this process in MB, None if unknown
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    return None
+
+
+def max_rss_mb():
+    # returns peak resident set size of this process so far in MB, None if unknown
+    if psutil is not None and hasattr(psutil.Process().memory_info(), 'peak_wset'):  # Windows
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1024 ** 2 if platform.system() == 'Darwin' else maxrss / 1024  # bytes on mac, kB elsewhere
+    return None
+
+
+class _RssSampler(threading.Thread):
+    # background thread keeping the highest RSS seen until stop() is called
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(sample_interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, rss_mb())
+        return self.peak
+
+
+@contextlib.contextmanager
+def stage(name, snl=None, rows=None):
+    # time the enclosed block as stage *name*, optionally for snl type *snl*. Yields the record, so that the block can
+    # set rec['rows'] once it is known
+    global _depth
+    rec = {'stage': name, 'snl': snl, 'rows': rows, 'pid': os.getpid(), 'start': timestamps.get_timestring('full')}
+    sampler = _RssSampler() if psutil is not None else None
+    if sampler is not None:
+        sampler.start()
+    profiler = cProfile.Profile() if profile_dir is not None and _depth == 0 else None
+    _depth += 1
+    rss0 = rss_mb()
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield rec
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        rec['wall_s'] = time.perf_counter() - wall0
+        rec['cpu_s'] = time.process_time() - cpu0
+        _depth -= 1
+        rec['rss_start_mb'] = rss0
+        rec['rss_end_mb'] = rss_mb()
+        rec['peak_rss_mb'] = sampler.stop() if sampler is not None else max_rss_mb()
+        if profiler is not None and rec['wall_s'] > _slowest['wall_s']:
+            _keep_profile(profiler, rec)
+        records.append(rec)
+
+
+def _keep_profile(profiler, rec):
+    # dump the profile of *rec*, the slowest stage in this process so far, over that of the previous slowest
+    if _slowest['profile'] is not None:
+        _slowest['profile'].pop('profile', None)
+    os.makedirs(profile_dir, exist_ok=True)
+    rec['profile'] = os.path.join(profile_dir, 'slowest_stage_{0}.prof'.format(os.getpid()))
+    profiler.dump_stats(rec['profile'])
+    _slowest['wall_s'], _slowest['profile'] = rec['wall_s'], rec
+
+
+def staged(name):
+    # decorator version of stage(), the row count is the length of the return value where it has one. Pass snl as
+    # keyword argument *snl* of the decorated function to label the record with the snl type
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, snl=kwargs.get('snl')) as rec:
+                out = func(*args, **kwargs)
+                if hasattr(out, '__len__'):
+                    rec['rows'] = len(out)
+            return out
+        return wrapper
+    return decorator
+
+
+def pop_records():
+    # returns the records of this process and clears them, see parallel.run_per_type
+    global records
+    out, records = records, []
+    return out
+
+
+def summary(recs=None):
+    # returns pandas dataframe with totals per stage: wall and CPU time, highest peak RSS, rows and number of calls,
+    # slowest stage first
+    df = pd.DataFrame(recs if recs is not None else records)
+    if df.empty:
+        return df
+    return df.groupby('stage').agg(wall_s=('wall_s', 'sum'), cpu_s=('cpu_s', 'sum'), peak_rss_mb=('peak_rss_mb', 'max'),
+                                   rows=('rows', 'sum'), calls=('stage', 'size')).sort_values('wall_s',
+                                                                                             ascending=False)
+
+
+def write_report(path, info=None):
+    # write the records of this run to *path*, as JSON (with *info* dictionary, totals per stage and the slowest stage)
+    # when path ends with .json, otherwise as semicolon separated table with one row per stage record
+    df = pd.DataFrame(records)
+    if path.endswith('.json'):
+        slowest = max(records, key=lambda rec: rec['wall_s']) if records else None
+        report = {'created': timestamps.get_timestring('full'), 'info': info or {}, 'slowest': slowest,
+                  'summary': summary().reset_index().to_dict(orient='records'), 'records': records}
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1, default=str)
+    else:
+        with open(path, 'w') as f:
+            f.write('# Stage timings PGO Hotspots, {0}\n'.format(timestamps.get_timestring('full')))
+            df.to_csv(f, sep=';', header=True, index=False)
+    print('Stage report written to {0}'.format(path))
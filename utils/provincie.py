@@ -0,0 +1,90 @@
+# Precomputed lookup from 250m hok to provincie, with the fraction of the hok in each provincie, and zonal statistics
+# that aggregate any per-hok metric to provincie level. The lookup is built by prepare_data/create_250m_mesh.py from
+# the provincies rasterized on the 250m grid (see utils/mesh.py) and stored as arrays in a versioned npz file.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import os
+import numpy as np
+import pandas as pd
+
+from utils import timestamps
+
+prov_index_dir = r'd:\hotspot_working\shp_250mgrid'
+prov_version = 'provincies_2018'  # version of the provincie boundaries, part of the file name
+
+_prov_index = {}
+
+
+def prov_index_path(version=prov_version):
+    return os.path.join(prov_index_dir, 'hok250m_prov_{0}.npz'.format(version))
+
+
+def save_prov_index(hok_id, zone, fraction, names, version=prov_version):
+    # write lookup of (hok_id, zone, fraction) elements, where zone is the position in array *names* of provincie
+    # names, sorted by hok_id
+    order = np.lexsort((zone, hok_id))
+    np.savez(prov_index_path(version), hok_id=np.asarray(hok_id, dtype=np.int64)[order],
+             zone=np.asarray(zone, dtype=np.int16)[order], fraction=np.asarray(fraction, dtype=np.float32)[order],
+             names=np.asarray(names, dtype=str), version=version, created=timestamps.get_timestring('full'))
+
+
+def load_prov_index(version=prov_version):
+    # returns dictionary with arrays hok_id, zone, fraction and names. Cached per process
+    if version not in _prov_index:
+        try:
+            with np.load(prov_index_path(version)) as npz:
+                _prov_index[version] = {key: npz[key] for key in ['hok_id', 'zone', 'fraction', 'names']}
+        except OSError:
+            raise Exception('Sorry, provincie index {0} not found, run prepare_data/create_250m_mesh.py '
+                            'first.'.format(prov_index_path(version)))
+    return _prov_index[version]
+
+
+def _lookup(hok_id, index):
+    # returns (position in *hok_id*, position in index) for all index elements of the hok_ids
+    left = np.searchsorted(index['hok_id'], hok_id, side='left')
+    counts = np.searchsorted(index['hok_id'], hok_id, side='right') - left
+    pos = np.repeat(np.arange(len(hok_id)), counts)
+    elem = np.repeat(left - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return pos, elem
+
+
+def dominant_provincie(hok_id, version=prov_version):
+    # returns array with the name of the provincie covering the largest part of each hok, None outside provincies
+    index = load_prov_index(version)
+    hok_id = np.asarray(hok_id, dtype=np.int64)
+    pos, elem = _lookup(hok_id, index)
+    order = np.lexsort((index['fraction'][elem], pos))  # per hok, the largest fraction comes last
+    pos, elem = pos[order], elem[order]
+    last = np.ones(pos.size, dtype=bool)
+    last[:-1] = pos[1:] != pos[:-1]
+    out = np.full(len(hok_id), None, dtype=object)
+    out[pos[last]] = index['names'][index['zone'][elem[last]]]
+    return out
+
+
+def zonal_stats(hok_id, values, version=prov_version, weighted=True):
+    # returns dataframe indexed by provincie with the sum, mean and count of per-hok *values*. With weighted=True every
+    # hok contributes to each provincie with the fraction of the hok within that provincie, otherwise each hok counts
+    # fully in its dominant provincie only. NaN values are ignored
+    index = load_prov_index(version)
+    hok_id = np.asarray(hok_id, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    hok_id, values = hok_id[valid], values[valid]
+
+    pos, elem = _lookup(hok_id, index)
+    weight = index['fraction'][elem].astype(np.float64)
+    if not weighted:
+        dominant = dominant_provincie(hok_id, version)
+        keep = index['names'][index['zone'][elem]] == dominant[pos]
+        pos, elem, weight = pos[keep], elem[keep], np.ones(keep.sum())
+
+    n_zones = len(index['names'])
+    zone = index['zone'][elem]
+    total = np.bincount(zone, weights=values[pos] * weight, minlength=n_zones)
+    count = np.bincount(zone, weights=weight, minlength=n_zones)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    return pd.DataFrame({'sum': total, 'mean': mean, 'count': count},
+                        index=pd.Index(index['names'], name='provincie'))
@@ -0,0 +1,82 @@
+# Multi-resolution aggregation pyramid of the per-hok species counts: 250m hokken block-reduced to 1km, 5km and 10km
+# cells. Per coarse cell and per snl/periode/soortgroep/soortlijst the pyramid holds the sum and maximum of the species
+# counts n of the 250m hokken in it, and the number of occupied 250m hokken (n > 0). Each level is built from the one
+# below (1km from 250m, 5km from 1km, 10km from 5km) and written as Parquet dataset partitioned by soortgroep, so that
+# coarse maps and tables are read directly instead of re-aggregating millions of hokken. See prepare_data/prep_pyramid.py
+# Coarse cells are identified by an integer hok_id of their top-left corner, like the 250m hokken (grid.encode),
+# on blocks aligned to RD New 0, 0 (see grid.coarse_hok_id).
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import grid
+from utils import timestamps
+from utils import obs_schema
+
+pyramid_dir = r'd:\hotspot_working\pyramid'
+levels = {'1km': 1000, '5km': 5000, '10km': 10000}  # level name: cell size in m, from fine to coarse
+keys = ['snl', 'periode', 'soortgroep', 'soortlijst']
+
+
+def coarse_hok_id(hok_id, cellsize, fine_cellsize=250):
+    # returns array of integer hok_ids of the *cellsize* cells containing the cells *hok_id* of size *fine_cellsize*
+    return grid.coarse_hok_id(hok_id, cellsize, fine_cellsize)
+
+
+def block_reduce(cells, cellsize, fine_cellsize):
+    # reduce dataframe *cells* with hok_id, keys, n_sum, n_max and n_cells per *fine_cellsize* cell to the same per
+    # *cellsize* cell
+    cells = cells.assign(hok_id=coarse_hok_id(cells['hok_id'].values, cellsize, fine_cellsize))
+    return cells.groupby(['hok_id'] + keys, observed=True, sort=False).agg(
+        n_sum=('n_sum', 'sum'), n_max=('n_max', 'max'), n_cells=('n_cells', 'sum')).reset_index()
+
+
+def build_pyramid(obs, path=None):
+    # build all levels from observations dataframe *obs* (hok_id, n and keys, as from pgo.query_all_obs) and write
+    # them to directory *path*, pyramid_dir by default. Replaces the partitions of the soortgroepen present in *obs*
+    path = path or pyramid_dir
+    obs = obs_schema.apply_schema(obs[['hok_id', 'n'] + keys].copy())
+    cells = obs.assign(n=obs['n'].astype(np.int32)).groupby(['hok_id'] + keys, observed=True, sort=False)['n']\
+        .sum().reset_index()
+    cells = cells.assign(n_sum=cells['n'], n_max=cells['n'], n_cells=(cells['n'] > 0).astype(np.int32))\
+        .drop(columns='n')
+
+    fine_cellsize = 250
+    for level, cellsize in levels.items():
+        cells = block_reduce(cells, cellsize, fine_cellsize)
+        fine_cellsize = cellsize
+        level_dir = os.path.join(path, level)
+        for soortgroep in cells['soortgroep'].unique():
+            shutil.rmtree(os.path.join(level_dir, 'soortgroep={0}'.format(soortgroep)), ignore_errors=True)
+        pq.write_to_dataset(pa.Table.from_pandas(cells, preserve_index=False), root_path=level_dir,
+                            partition_cols=['soortgroep'], existing_data_behavior='overwrite_or_ignore')
+        print('\t{0} level: {1} cells x keys written at {2}'.format(level, cells.shape[0],
+                                                                    timestamps.get_timestring('full')))
+
+
+def read_level(level, selection=None, path=None):
+    # returns dataframe with hok_id, keys, n_sum, n_max and n_cells of *level* from the pyramid in directory *path*,
+    # pyramid_dir by default, restricted to *selection*, a dictionary of {column: [allowed values]} or ObsFilter
+    path = path or pyramid_dir
+    if hasattr(selection, 'selection'):
+        selection = selection.selection()
+    filters = [(col, 'in', values) for col, values in (selection or {}).items()]
+    try:
+        db = pd.read_parquet(os.path.join(path, level), filters=filters or None)
+    except OSError:
+        raise Exception('Sorry, the {0} level of the pyramid has not been built, see prepare_data/prep_pyramid.py.'
+                        .format(level))
+    return obs_schema.apply_schema(db)
+
+
+def level_pivot(level, stat='n_sum', columns=('periode', 'soortlijst'), selection=None, path=None):
+    # returns pivot table of *stat* (n_sum, n_max or n_cells) per coarse cell of *level*, with (Multi)Index *columns*.
+    # n_sum and n_cells are summed and n_max maximized over the keys not in *columns*, eg. over snl types
+    db = read_level(level, selection, path)
+    return pd.pivot_table(data=db, index='hok_id', columns=list(columns), values=stat, observed=True,
+                          aggfunc='max' if stat == 'n_max' else 'sum')
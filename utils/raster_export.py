@@ -0,0 +1,69 @@
+# Export of per-hok result columns straight to raster files on the 250m grid, as alternative to merging with the 250m
+# hokken GeoDataFrame and writing a shapefile. Writes a multi-band compressed GeoTIFF with the column names as band
+# descriptions, or one ascii grid per column.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import os
+import numpy as np
+import pandas as pd
+import rasterio as rio
+
+from utils import grid
+
+
+def cells_to_rowcol(hok_id, affine, shape):
+    # returns arrays row, col of the cells of integer *hok_id* on the grid given by *affine* and *shape*
+    row, col, inside = grid.hok_id_to_rowcol(hok_id, affine, shape)
+    if not inside.all():
+        raise Exception('Sorry, {0} hok_ids are outside of the grid.'.format((~inside).sum()))
+    return row, col
+
+
+def cells_to_array(hok_id, vals, affine, shape, nodata=-9999, dtype=np.float32):
+    # returns 2D array of *shape* with *vals* at the cells of integer *hok_id*, nodata elsewhere. Categorical values
+    # are written as their category codes
+    row, col = cells_to_rowcol(hok_id, affine, shape)
+
+    if isinstance(vals.dtype, pd.CategoricalDtype):
+        vals = pd.Series(vals.cat.codes, dtype=np.float64).where(vals.cat.codes >= 0)
+    vals = np.asarray(vals, dtype=np.float64)
+    out = np.full(shape, nodata, dtype=dtype)
+    out[row, col] = np.where(np.isnan(vals), nodata, vals)
+    return out
+
+
+def write_cells_raster(df, cols, path, affine, shape, driver='GTiff', nodata=-9999, dtype=np.float32):
+    # write columns *cols* of dataframe *df* with integer hok_id column to raster file(s) on the grid given by *affine*
+    # and *shape* (nrows, ncols). driver 'GTiff' writes one deflate-compressed GeoTIFF *path* with one band per column,
+    # named after the column. driver 'AAIGrid' writes one ascii grid per column, named <path without extension>_<col>.asc
+    if df['hok_id'].duplicated().any():
+        raise Exception('Sorry, hok_ids are not unique, cannot write one value per cell.')
+
+    hok_id = df['hok_id'].values
+    categories = {str(col): list(df[col].cat.categories) for col in cols
+                  if isinstance(df[col].dtype, pd.CategoricalDtype)}
+    profile = {'height': shape[0], 'width': shape[1], 'dtype': dtype, 'nodata': nodata, 'transform': affine,
+               'crs': 'EPSG:28992'}
+
+    if driver == 'GTiff':
+        with rio.open(path, 'w', driver='GTiff', count=len(cols), compress='deflate', predictor=2 if
+                      np.issubdtype(dtype, np.integer) else 3, tiled=True, **profile) as dst:
+            for band, col in enumerate(cols, start=1):
+                dst.write(cells_to_array(hok_id, df[col], affine, shape, nodata, dtype), band)
+                dst.set_band_description(band, str(col))
+                if str(col) in categories:
+                    # category codes 0, 1, ... refer to these labels
+                    dst.update_tags(band, categories=';'.join(str(c) for c in categories[str(col)]))
+        return [path]
+
+    elif driver == 'AAIGrid':
+        paths = []
+        for col in cols:
+            col_path = '{0}_{1}.asc'.format(os.path.splitext(path)[0], col)
+            with rio.open(col_path, 'w', driver='AAIGrid', count=1, **profile) as dst:
+                dst.write(cells_to_array(hok_id, df[col], affine, shape, nodata, dtype), 1)
+            paths.append(col_path)
+        return paths
+
+    else:
+        raise Exception('Sorry, driver {0} is not supported, choose GTiff or AAIGrid'.format(driver))
@@ -0,0 +1,101 @@
+# Sparse matrix of SNL area per 250m hok: rows are hokken, columns are SNL beheertypen (and ecosysteemtypen, as far as
+# there is an SNL grid for them), values are area in m2. Built once from the SNL grids by prepare_data/prep_asc.py, it
+# replaces reading one pickle per SNL type in pgo.get_snl_hokids.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import re
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils import asc_convert
+
+snl_matrix_path = r'd:\hotspot_working\a_broedvogels\SNL_grids\snl_matrix.npz'
+
+_snl_matrix = {}
+
+
+def build_snl_matrix(snl_bin_dir, path=None):
+    # build matrix from the SNL grids converted by asc_convert (kind 'snl') in *snl_bin_dir* and write it to *path*,
+    # snl_matrix_path by default
+    path = path or snl_matrix_path
+    manifest = sorted(asc_convert.read_manifest(snl_bin_dir), key=lambda entry: entry['snl'])
+    grids = [asc_convert.read_grid(snl_bin_dir, entry) for entry in manifest]
+
+    hok_id = np.unique(np.concatenate([grid['hok_id'].values for grid in grids]))
+    rows = np.concatenate([np.searchsorted(hok_id, grid['hok_id'].values) for grid in grids])
+    cols = np.concatenate([np.full(grid.shape[0], i) for i, grid in enumerate(grids)])
+    area = np.concatenate([grid['area_m2'].values for grid in grids]).astype(np.int32)
+    matrix = sparse.csr_matrix((area, (rows, cols)), shape=(hok_id.size, len(grids)))
+
+    np.savez(path, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr, shape=matrix.shape,
+             hok_id=hok_id, snl=np.array([entry['snl'] for entry in manifest], dtype=str))
+    print('SNL matrix of {0} hokken x {1} SNL types written to {2}'.format(hok_id.size, len(grids), path))
+
+
+def load_snl_matrix(path=None):
+    # returns (csr matrix, array of hok_ids per row, list of snl types per column) from *path*, snl_matrix_path by
+    # default. Cached per process
+    path = path or snl_matrix_path
+    if path not in _snl_matrix:
+        try:
+            with np.load(path) as npz:
+                matrix = sparse.csr_matrix((npz['data'], npz['indices'], npz['indptr']), shape=tuple(npz['shape']))
+                _snl_matrix[path] = (matrix, npz['hok_id'], npz['snl'].tolist())
+        except OSError:
+            raise Exception('Sorry, SNL matrix {0} not found, run prepare_data/prep_asc.py first.'.format(path))
+    return _snl_matrix[path]
+
+
+def beheertypen(snl_types):
+    # the SNL beheertype codes (eg. N1705) among *snl_types*
+    return [snl for snl in snl_types if re.fullmatch(r'N\d{4}', snl)]
+
+
+def resolve(snl, path=None):
+    # returns the list of snl types selected by *snl*, a list of snl types, or 'all' for all beheertypen
+    snl_types = load_snl_matrix(path)[2]
+    if snl == 'all' or snl == ['all']:
+        return beheertypen(snl_types)
+    missing = [snl_type for snl_type in snl if snl_type not in snl_types]
+    if missing:
+        raise Exception('Sorry, no SNL grid for {0}'.format(', '.join(missing)))
+    return list(snl)
+
+
+def select(snl, treshold, path=None):
+    # returns sparse matrix (hokken x requested snl types) with entries >= *treshold* only, and the hok_ids per row.
+    # *snl* is a list of snl types, or 'all' for all beheertypen
+    matrix, hok_id, snl_types = load_snl_matrix(path)
+    snl = resolve(snl, path)
+
+    sel = matrix[:, [snl_types.index(snl_type) for snl_type in snl]].tocsr()
+    sel.data[sel.data < treshold] = 0
+    sel.eliminate_zeros()
+    return sel, hok_id
+
+
+def snl_hokids(snl, treshold, path=None):
+    # returns dataframe with hok_id, snl_count (number of requested snl types with area >= treshold in the hok) and
+    # snl_area_m2 (summed area of these), for all hokken where snl_count > 0
+    sel, hok_id = select(snl, treshold, path)
+    count = sel.getnnz(axis=1)
+    area = np.asarray(sel.sum(axis=1)).ravel()
+    has_snl = count > 0
+    return pd.DataFrame({'hok_id': hok_id[has_snl], 'snl_count': count[has_snl], 'snl_area_m2': area[has_snl]})
+
+
+def ecosys_area(ecosys_types, trans, path=None):
+    # returns dataframe with hok_id and the summed beheertype area per ecosysteemtype in *ecosys_types*, rolled up
+    # from the beheertypen with *trans*, a function returning the beheertypen of an ecosysteemtype (pgo.ecosys_2_beheer)
+    matrix, hok_id, snl_types = load_snl_matrix(path)
+    rollup = np.zeros((len(snl_types), len(ecosys_types)), dtype=np.int32)
+    for j, ecosys in enumerate(ecosys_types):
+        for beheertype in trans(ecosys):
+            if beheertype in snl_types:
+                rollup[snl_types.index(beheertype), j] = 1
+    area = (matrix @ sparse.csr_matrix(rollup)).toarray()
+    has_area = area.any(axis=1)
+    out = pd.DataFrame(area[has_area], columns=ecosys_types)
+    out.insert(0, 'hok_id', hok_id[has_area])
+    return out
@@ -0,0 +1,92 @@
+# Writing of the tabular deliverables. Tables are written to disk in chunks of rows, so that no filled, retyped copy of
+# the full table and no CSV string of the full table is built in memory.
+#  - missing values are written as *sentinel* (9999), in integer and float columns alike,
+#  - float columns holding whole numbers only (species counts after a pivot or merge) are written as integers,
+#  - integer hok_id columns are written in the string form "{x_rd}_{y_rd}", see grid.to_str.
+# The '#' comment header block goes on top of the CSV. write_parquet writes the same table as Parquet for downstream
+# use, with integer hok_id, missing values as nulls and the header lines in the file metadata.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import grid
+
+sentinel = 9999  # written for missing values
+chunksize = 100000  # rows per chunk
+
+
+def write_header(f, lines):
+    # write *lines* to open file *f* as '#' comment lines
+    for line in lines:
+        f.write('# {0}\n'.format(line.lstrip('# ').rstrip('\n')))
+
+
+def whole_number_cols(df):
+    # returns list of the float columns of *df* holding whole numbers (and missing values) only
+    out = []
+    for col in df.columns[[pd.api.types.is_float_dtype(dtype) for dtype in df.dtypes]]:
+        vals = df[col].values
+        finite = vals[~np.isnan(vals)]
+        if np.array_equal(finite, np.floor(finite)) and (finite.size == 0 or np.abs(finite).max() < 2 ** 31):
+            out.append(col)
+    return out
+
+
+def _export_chunk(chunk, int_cols, hok_id_cols):
+    # returns copy of *chunk* as written to CSV: sentinel for missing values in *int_cols*, integer dtype, hok_ids as
+    # strings
+    chunk = chunk.copy()
+    for col in int_cols:
+        chunk[col] = chunk[col].fillna(sentinel).astype(np.int32)
+    for col in [col for col in hok_id_cols if col in chunk.columns]:
+        chunk[col] = grid.to_str(chunk[col]).values
+    if chunk.index.name in hok_id_cols and pd.api.types.is_integer_dtype(chunk.index):
+        chunk.index = pd.Index(grid.to_str(chunk.index.values).values, name=chunk.index.name)
+    elif pd.api.types.is_float_dtype(chunk.index) and np.array_equal(chunk.index, np.floor(chunk.index)):
+        chunk.index = chunk.index.astype(np.int64)  # eg. histogram of species count differences
+    return chunk
+
+
+def write_csv(f, df, index=False, hok_id_cols=('hok_id',)):
+    # write dataframe *df* to open file *f* as semicolon separated table in chunks of *chunksize* rows, see above.
+    # *hok_id_cols* are the (index) columns holding integer hok_ids
+    int_cols = whole_number_cols(df)
+    hok_id_cols = [col for col in hok_id_cols if col in df.columns and pd.api.types.is_integer_dtype(df[col])] + \
+                  [col for col in hok_id_cols if col == df.index.name]
+    for start in range(0, max(df.shape[0], 1), chunksize):
+        chunk = _export_chunk(df.iloc[start:start + chunksize], int_cols, hok_id_cols)
+        chunk.to_csv(f, sep=';', header=start == 0, index=index, na_rep=str(sentinel))
+
+
+def write_table(path, df, header_lines=(), index=False):
+    # write dataframe *df* to CSV file *path* with *header_lines* as '#' comment block on top
+    with open(path, 'w') as f:
+        write_header(f, header_lines)
+        write_csv(f, df, index=index)
+
+
+def write_parquet(path, df, header_lines=(), index=False):
+    # write dataframe *df* to Parquet file *path* in row groups of *chunksize* rows, with *header_lines* in the file
+    # metadata under key 'pgo_header'. Whole number float columns are written as nullable integers
+    int_cols = whole_number_cols(df)
+    df = df.reset_index() if index else df
+    if isinstance(df.columns, pd.MultiIndex):
+        raise Exception('Sorry, flatten the column names before writing to Parquet.')
+    schema = None
+    writer = None
+    try:
+        for start in range(0, max(df.shape[0], 1), chunksize):
+            chunk = df.iloc[start:start + chunksize].astype({col: 'Int32' for col in int_cols})
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema.with_metadata(dict(table.schema.metadata or {},
+                                                         pgo_header='\n'.join(header_lines)))
+                table = table.replace_schema_metadata(schema.metadata)
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,14 @@
+# Time stamps of the PGO scripts and utils: 'full' for progress messages and table headers, 'brief' for file names.
+# Hans Roelofsen, WEnR, 18/10/2026
+
+import datetime
+
+
+def get_timestring(timetype):
+    t0 = datetime.datetime.now()
+    if timetype == 'full':
+        return t0.strftime("%Y-%m-%d_%H:%M:%S")
+    elif timetype == 'brief':
+        return t0.strftime("%y%m%d-%H%M")
+    else:
+        return t0